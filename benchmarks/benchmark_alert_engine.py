@@ -0,0 +1,77 @@
+# Description: Benchmark of the alert engine updates on new five-minute observations, against classifying the
+# complete merged series again on every poll and comparing the last class of each station.
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.alert_engine import AlertEngine, JsonlAlertSink
+from forecast_flood_impact.calculate_return_periods import classify_return_periods
+from forecast_flood_impact.threshold_registry import ThresholdRegistry
+
+threshold_csv = Path(__file__).resolve().parents[1] / 'flood_frequency_analysis' / 'ffa_summary_for_tool.csv'
+
+def synthetic_observations(stations, times, rng):
+    """
+    Long format observations of the stations, slowly varying around the 2 year thresholds
+    """
+    n_times = len(times)
+    levels = 50 + 40 * np.sin(np.linspace(0, 12 * np.pi, n_times))[:, None] + rng.normal(0, 5, (n_times, len(stations)))
+    return pd.DataFrame({'STATION_NUMBER': np.tile(stations, n_times), 'DISCHARGE': levels.ravel()},
+                        index=pd.DatetimeIndex(np.repeat(times, len(stations)), name='DATETIME'))
+
+def recompute_transitions(history_df, new_df, registry, last_classes):
+    """
+    Classify the merged series again and compare the last class of each station with the previous poll
+    """
+    merged_df = pd.concat([history_df, new_df])
+    classes = classify_return_periods(merged_df, registry)
+    current = classes.groupby('STATION_NUMBER', observed=True)['Exceedance'].last()
+    changed = current[current.astype(object) != last_classes.reindex(current.index).astype(object)]
+    return merged_df, current, len(changed)
+
+def main(n_stations=200, n_days=30, n_polls=12):
+
+    threshold_df = pd.read_csv(threshold_csv)
+    source_stations = threshold_df.columns.drop('T_yrs')
+    stations = np.array([f'{source_stations[i % len(source_stations)]}_{i:04d}' for i in range(n_stations)], dtype=object)
+    scaled_df = pd.concat([threshold_df[['T_yrs']]] + [threshold_df[source_stations[i % len(source_stations)]].rename(station)
+                                                        for i, station in enumerate(stations)], axis=1)
+    registry = ThresholdRegistry.from_table(scaled_df)
+
+    rng = np.random.default_rng(42)
+    times = pd.date_range('2024-05-01', periods=n_days * 288 + n_polls, freq='5min')
+    observations_df = synthetic_observations(stations, times, rng)
+    history_df = observations_df.iloc[:-n_polls * n_stations]
+    polls = [observations_df.iloc[len(history_df) + i * n_stations:len(history_df) + (i + 1) * n_stations] for i in range(n_polls)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = AlertEngine(registry, JsonlAlertSink(Path(tmp_dir, 'alerts.jsonl')))
+        engine.update_observations(history_df)
+
+        start = time.perf_counter()
+        n_alerts = sum(len(engine.update_observations(poll_df)) for poll_df in polls)
+        engine_time = (time.perf_counter() - start) / n_polls
+
+    last_classes = classify_return_periods(history_df, registry).groupby('STATION_NUMBER', observed=True)['Exceedance'].last()
+    merged_df = history_df
+    start = time.perf_counter()
+    for poll_df in polls:
+        merged_df, last_classes, _ = recompute_transitions(merged_df, poll_df, registry, last_classes)
+    recompute_time = (time.perf_counter() - start) / n_polls
+
+    engine_classes = pd.Series({station: engine.station_summary(station)['class'] for station in stations})
+    if not (engine_classes.astype(object) == last_classes.reindex(engine_classes.index).astype(object)).all():
+        raise AssertionError('Engine classes differ from the recomputed classes')
+
+    print(f'{n_stations} stations x {len(history_df) // n_stations} observations, {n_polls} polls of one observation per station, '
+          f'{n_alerts} alerts, classes identical')
+    print(f'recompute merged series:  {recompute_time * 1e3:8.2f} ms per poll')
+    print(f'alert engine update:      {engine_time * 1e3:8.2f} ms per poll ({recompute_time / engine_time:.0f}x faster)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Description: Benchmark of the import time of the package modules, each imported in a fresh interpreter,
+# with the heavy backends (matplotlib, cartopy, owslib, xarray, shapely, geopandas) they load at import.
+import subprocess
+import sys
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parents[1]
+
+MODULES = ['threshold_registry', 'bias_correction', 'climatology', 'calculate_return_periods', 'scalar_data_access',
+           'run_pipeline', 'cycle_scheduler', 'nsrps_data_access', 'hydrograph_plotting', 'batch_rendering',
+           'geospatial_plotting']
+BACKENDS = ['matplotlib', 'cartopy', 'owslib', 'xarray', 'shapely', 'geopandas']
+
+PROBE = '''
+import sys, time
+sys.path.insert(0, {repo_dir!r})
+start = time.perf_counter()
+import forecast_flood_impact.{module}
+print(time.perf_counter() - start)
+print(','.join(name for name in {backends!r} if name in sys.modules))
+'''
+
+def import_time(module, repeat=3):
+    """
+    Best import time of a module over fresh interpreters, and the backends loaded by the import
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(repo_dir=str(repo_dir), module=module,
+                                                                    backends=BACKENDS)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        seconds, backends = result.stdout.splitlines()[-2:]
+        best = float(seconds) if best is None else min(best, float(seconds))
+    return best, backends
+
+def main(repeat=3):
+    print(f'{"module":<26}{"import (s)":>11}  backends loaded')
+    for module in MODULES:
+        seconds, backends = import_time(module, repeat)
+        if seconds is None:
+            print(f'{module:<26}{"-":>11}  not importable: {backends}')
+        else:
+            print(f'{module:<26}{seconds:>11.3f}  {backends}')
+
+if __name__ == '__main__':
+    main()
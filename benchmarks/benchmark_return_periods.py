@@ -0,0 +1,88 @@
+# Description: Benchmark of the vectorised return period classification against the original iterrows loop.
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.calculate_return_periods import classify_return_periods
+
+threshold_csv = Path(__file__).resolve().parents[1] / 'flood_frequency_analysis' / 'ffa_summary_for_tool.csv'
+
+def calculate_return_periods_iterrows(realtime_df, forecast_df, threshold_df, station_number):
+    """
+    Original row-by-row implementation of calculate_return_periods, kept as the reference result.
+    """
+    merged_df = pd.concat([realtime_df, forecast_df])
+    station_data = merged_df[merged_df['STATION_NUMBER'] == station_number]
+
+    # Initialize a result dataframe
+    result = pd.DataFrame(index=station_data.index)
+
+    # Extract threshold values for the specified station
+    station_thresholds = threshold_df[['T_yrs', station_number]].sort_values(by='T_yrs', ascending=False)
+
+    # Check exceedance
+    for datetime, row in station_data.iterrows():
+        discharge = row['DISCHARGE']
+        exceeded_thresholds = station_thresholds[station_thresholds[station_number] <= discharge]['T_yrs']
+        max_exceeded_threshold = exceeded_thresholds.max() if not exceeded_thresholds.empty else 'Less than 2 year'
+        result.at[datetime, 'Exceedance'] = max_exceeded_threshold
+
+    return result
+
+def synthetic_discharge(threshold_df, n_stations, n_steps, seed=42):
+    """
+    Build a long format realtime (5 minute) discharge frame spanning the threshold range of each station.
+    """
+    rng = np.random.default_rng(seed)
+    source_stations = threshold_df.columns.drop('T_yrs')
+    index = pd.date_range('2024-05-01', periods=n_steps, freq='5min', name='DATETIME')
+
+    frames = []
+    thresholds = threshold_df.copy()
+    for i in range(n_stations):
+        source = source_stations[i % len(source_stations)]
+        station_number = f'{source}_{i:04d}'
+        thresholds[station_number] = threshold_df[source]
+        upper = threshold_df[source].max() * 1.2
+        discharge = rng.uniform(0, upper, n_steps)
+        discharge[rng.random(n_steps) < 0.01] = np.nan
+        frames.append(pd.DataFrame({'STATION_NUMBER': station_number, 'DISCHARGE': discharge}, index=index))
+
+    return pd.concat(frames), thresholds
+
+def main(n_stations=5, n_steps=2016):
+
+    threshold_df = pd.read_csv(threshold_csv)
+    discharge_df, thresholds = synthetic_discharge(threshold_df, n_stations, n_steps)
+    station_numbers = discharge_df['STATION_NUMBER'].unique()
+    empty_forecast = discharge_df.iloc[0:0]
+
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # The original loop upcasts the result column from float to object as it goes
+        warnings.simplefilter('ignore', FutureWarning)
+        reference = {station: calculate_return_periods_iterrows(discharge_df, empty_forecast, thresholds, station)
+                     for station in station_numbers}
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = classify_return_periods(discharge_df, thresholds)
+    vectorised_time = time.perf_counter() - start
+
+    for station in station_numbers:
+        station_result = result.loc[result['STATION_NUMBER'] == station, 'Exceedance'].astype(object)
+        expected = reference[station]['Exceedance']
+        if not (station_result.to_numpy() == expected.to_numpy()).all():
+            raise AssertionError(f'Vectorised classification differs from the reference for station {station}')
+
+    print(f'{n_stations} stations x {n_steps} steps: results identical')
+    print(f'iterrows loop:  {loop_time:.3f} s')
+    print(f'vectorised:     {vectorised_time:.3f} s ({loop_time / vectorised_time:.0f}x faster)')
+
+if __name__ == '__main__':
+    main()
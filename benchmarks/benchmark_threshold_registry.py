@@ -0,0 +1,66 @@
+# Description: Benchmark of the threshold registry lookups against selecting and sorting the thresholds of the
+# station in the threshold table on every call.
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.threshold_registry import ThresholdRegistry
+
+threshold_csv = Path(__file__).resolve().parents[1] / 'flood_frequency_analysis' / 'ffa_summary_for_tool.csv'
+
+def largest_exceeded_original(threshold_df, station_number, discharge):
+    """
+    Largest exceeded return period of one value, from the sorted thresholds of the station in the table
+    """
+    station_thresholds = threshold_df[['T_yrs', station_number]].sort_values(by='T_yrs', ascending=False)
+    exceeded_thresholds = station_thresholds[station_thresholds[station_number] <= discharge]['T_yrs']
+    return exceeded_thresholds.max() if not exceeded_thresholds.empty else np.nan
+
+def main(n_stations=2000, n_values=1000, n_bulk_values=1_000_000):
+
+    threshold_df = pd.read_csv(threshold_csv)
+    source_stations = threshold_df.columns.drop('T_yrs')
+    # Thousands of stations, repeating the thresholds of the analysed stations
+    stations = [f'{source_stations[i % len(source_stations)]}_{i:04d}' for i in range(n_stations)]
+    scaled_df = pd.concat([threshold_df[['T_yrs']]] + [threshold_df[source_stations[i % len(source_stations)]].rename(station)
+                                                        for i, station in enumerate(stations)], axis=1)
+
+    rng = np.random.default_rng(42)
+    value_stations = rng.choice(stations, n_values)
+    values = rng.uniform(0, 1300, n_values)
+
+    start = time.perf_counter()
+    reference = [largest_exceeded_original(scaled_df, station, value) for station, value in zip(value_stations, values)]
+    original_time = (time.perf_counter() - start) / n_values
+
+    start = time.perf_counter()
+    registry = ThresholdRegistry.from_table(scaled_df)
+    load_time = time.perf_counter() - start
+
+    counts = registry.exceeded_counts(value_stations, values)
+    classes = np.where(counts > 0, registry.t_yrs[np.maximum(counts - 1, 0)], np.nan)
+    if not np.allclose(classes, np.array(reference, dtype=float), equal_nan=True):
+        raise AssertionError('Registry classes differ from the reference')
+
+    start = time.perf_counter()
+    for station, value in zip(value_stations, values):
+        registry.return_period(station, value)
+    scalar_time = (time.perf_counter() - start) / n_values
+
+    bulk_stations = rng.choice(stations, n_bulk_values)
+    bulk_values = rng.uniform(0, 1300, n_bulk_values)
+    start = time.perf_counter()
+    registry.return_periods(bulk_stations, bulk_values)
+    bulk_time = (time.perf_counter() - start) / n_bulk_values
+
+    print(f'{n_stations} stations: registry loaded in {load_time * 1e3:.1f} ms, classes identical')
+    print(f'sort per call:              {original_time * 1e6:8.1f} us per value')
+    print(f'registry, single value:     {scalar_time * 1e6:8.1f} us per value ({original_time / scalar_time:.0f}x faster)')
+    print(f'registry, {n_bulk_values} values: {bulk_time * 1e6:8.3f} us per value ({original_time / bulk_time:.0f}x faster)')
+
+if __name__ == '__main__':
+    main()
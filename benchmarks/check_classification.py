@@ -0,0 +1,101 @@
+# Description: Regression check of the return period classification against the original per-station function,
+# for thresholds decreasing with T_yrs, missing thresholds and missing T_yrs, one station or many at a time.
+#
+# Usage: python benchmarks/check_classification.py
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.calculate_return_periods import calculate_return_periods, classify_return_periods, BELOW_LOWEST_THRESHOLD
+from forecast_flood_impact.threshold_registry import ThresholdRegistry
+
+# The irregular thresholds are logged as warnings by the registry
+logging.getLogger().setLevel(logging.ERROR)
+
+threshold_csv = Path(__file__).resolve().parents[1] / 'flood_frequency_analysis' / 'ffa_summary_for_tool.csv'
+
+def calculate_return_periods_original(realtime_df, forecast_df, threshold_df, station_number):
+    """
+    Classification of the baseline, the largest return period whose threshold is exceeded by each row
+    """
+    merged_df = pd.concat([realtime_df, forecast_df])
+    station_data = merged_df[merged_df['STATION_NUMBER'] == station_number]
+
+    result = pd.DataFrame(index=station_data.index, columns=['Exceedance'], dtype=object)
+    station_thresholds = threshold_df[['T_yrs', station_number]].sort_values(by='T_yrs', ascending=False)
+
+    for datetime, row in station_data.iterrows():
+        discharge = row['DISCHARGE']
+        exceeded_thresholds = station_thresholds[station_thresholds[station_number] <= discharge]['T_yrs']
+        max_exceeded_threshold = exceeded_thresholds.max() if not exceeded_thresholds.empty else 'Less than 2 year'
+        result.at[datetime, 'Exceedance'] = max_exceeded_threshold
+
+    return result
+
+def irregular_thresholds():
+    """
+    Threshold table of the analysed stations, with stations added whose thresholds decrease with T_yrs,
+    are partly or completely missing, and a missing T_yrs row
+    """
+    threshold_df = pd.read_csv(threshold_csv)
+    t_yrs = threshold_df['T_yrs'].to_numpy()
+    rng = np.random.default_rng(42)
+
+    irregular = {
+        # T2=100, T5=90, T10=200: a value of 95 is in the 5 year class
+        'DECREASING': np.r_[100, 90, 200, np.linspace(210, 400, len(t_yrs) - 3)],
+        'SHUFFLED': rng.permutation(np.linspace(50, 500, len(t_yrs))),
+        'MISSING_LOW': np.r_[np.nan, np.linspace(80, 400, len(t_yrs) - 1)],
+        'MISSING_MIDDLE': np.where(np.arange(len(t_yrs)) == 2, np.nan, np.linspace(50, 400, len(t_yrs))),
+        'MISSING_HIGH': np.r_[np.linspace(50, 300, len(t_yrs) - 2), np.nan, np.nan],
+        'MISSING_ALL': np.full(len(t_yrs), np.nan),
+    }
+    threshold_df = threshold_df.assign(**irregular)
+
+    # A return period without a value is ignored, its threshold above the 2 year threshold so that the original
+    # always has a return period exceeded with it
+    return pd.concat([threshold_df, pd.DataFrame({'T_yrs': [np.nan], 'DECREASING': [150.0]})], ignore_index=True)
+
+def check_classification(n_values=400):
+    threshold_df = irregular_thresholds()
+    stations = threshold_df.columns.drop('T_yrs').tolist()
+
+    rng = np.random.default_rng(42)
+    times = pd.date_range('2024-05-01', periods=n_values, freq='h')
+    discharge_df = pd.concat([pd.DataFrame({'STATION_NUMBER': station, 'DISCHARGE': np.r_[rng.uniform(0, 1300, n_values - 4), 91, 95, np.nan, 1e9]},
+                                           index=pd.DatetimeIndex(times, name='DATETIME'))
+                              for station in stations])
+    empty_df = discharge_df.iloc[:0]
+
+    registry = ThresholdRegistry.from_table(threshold_df)
+    classes = classify_return_periods(discharge_df, registry)
+
+    for station in stations:
+        reference = calculate_return_periods_original(discharge_df, empty_df, threshold_df, station)['Exceedance']
+        # A missing discharge exceeds no threshold
+        reference = reference.where(discharge_df.loc[discharge_df['STATION_NUMBER'] == station, 'DISCHARGE'].notna(), BELOW_LOWEST_THRESHOLD)
+
+        # All stations in one registry, and one station table as subset by calculate_return_periods
+        station_classes = classes.loc[classes['STATION_NUMBER'] == station, 'Exceedance'].astype(object)
+        single_classes = calculate_return_periods(discharge_df, empty_df, threshold_df, station)['Exceedance'].astype(object)
+        for name, result in [('registry', station_classes), ('single station table', single_classes)]:
+            if not (result.to_numpy() == reference.to_numpy()).all():
+                differences = pd.DataFrame({'reference': reference, name: result})[result.to_numpy() != reference.to_numpy()]
+                raise AssertionError(f'Classes of station {station} from the {name} differ from the original:\n{differences.head()}')
+
+    unknown = classify_return_periods(discharge_df.assign(STATION_NUMBER='UNKNOWN').iloc[:10], registry)
+    if not unknown['Exceedance'].isna().all() or not np.isnan(registry.return_periods(['UNKNOWN'], [100.0])).all():
+        raise AssertionError('Stations without thresholds are not left as NaN')
+
+    print(f'classification: {len(stations)} stations x {n_values} values, decreasing and missing thresholds, '
+          f'identical to the original')
+
+def main():
+    check_classification()
+
+if __name__ == '__main__':
+    main()
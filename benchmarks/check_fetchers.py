@@ -0,0 +1,102 @@
+# Description: Reproducible check of the parallel fetchers against the local mock servers: the parallel output must be
+# identical to the serial output, also when server errors and timeouts are injected and recovered by the retries.
+#
+# Usage: python benchmarks/check_fetchers.py
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import xarray as xr
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.nsrps_data_access import (extent_subsets, tile_subsets, query_wms_service_for_forecast_times,
+                               query_wcs_service_for_forecast_data)
+from forecast_flood_impact.scalar_data_access import retrieve_data_from_api, retrieve_data_from_api_parallel, read_station_csv, compact_station_frame
+from forecast_flood_impact.station_store import read_station_data
+from mock_servers import MockGeoMet, MockFeatures, synthetic_features
+
+# The retries of the injected faults are logged as warnings by the fetchers
+logging.getLogger().setLevel(logging.ERROR)
+
+sample_grid_nc = Path(__file__).resolve().parents[1] / 'gis_data' / 'sample_analysis.nc'
+
+MOCK_LOGIN = {'Username': None, 'Password': None}
+
+# Each data request first fails with a server error, then times out, and succeeds on the third attempt. The timeout
+# is well above the slowest response of the mock servers (about 0.25 s), so only the injected timeouts reach it
+FAULTS = [503, 'timeout']
+TIMEOUT = 2.0
+FAULT_DELAY = 3.0
+
+def check_wcs_fetch(n_lead_times=3, tile_size=1.0):
+    """
+    Forecast lead times fetched by one worker on the whole extent, against eight workers on tiles with injected faults
+    """
+    with xr.open_dataset(sample_grid_nc) as sample_ds:
+        grid_ds = sample_ds.isel(time=0, drop=True).load()
+    extent = (float(grid_ds['lat'].min()), float(grid_ds['lat'].max()), float(grid_ds['lon'].min()), float(grid_ds['lon'].max()))
+
+    with MockGeoMet(grid_ds, n_lead_times=n_lead_times) as mock:
+        newest_fcast, fcasthrs = query_wms_service_for_forecast_times(mock.layer_name, MOCK_LOGIN, geomet_url=mock.url)
+        serial_ds = query_wcs_service_for_forecast_data(mock.layer_name, MOCK_LOGIN, newest_fcast, fcasthrs, geomet_url=mock.url,
+                                                        max_workers=1, tiles=[extent_subsets(extent)])
+
+    tiles = tile_subsets(extent, tile_size)
+    with MockGeoMet(grid_ds, n_lead_times=n_lead_times, faults=FAULTS, fault_delay=FAULT_DELAY) as mock:
+        parallel_ds, report = query_wcs_service_for_forecast_data(mock.layer_name, MOCK_LOGIN, newest_fcast, fcasthrs,
+                                                                  geomet_url=mock.url, max_workers=8, max_retries=3,
+                                                                  retry_backoff=0.1, timeout=TIMEOUT, tiles=tiles,
+                                                                  return_report=True)
+        injected_faults = mock.injected_faults
+
+    if injected_faults != len(FAULTS) * n_lead_times * len(tiles):
+        raise AssertionError(f'{injected_faults} faults injected, {len(FAULTS) * n_lead_times * len(tiles)} expected')
+    if not (report['status'] == 'ok').all() or not (report['attempts'] == len(FAULTS) + 1).all():
+        raise AssertionError(f'Lead times not recovered by the retries:\n{report}')
+    xr.testing.assert_identical(serial_ds, parallel_ds)
+
+    print(f'wcs_fetch: {n_lead_times} lead times x {len(tiles)} tiles, {injected_faults} injected faults recovered, '
+          f'identical to the serial fetch')
+
+def check_features_fetch(n_stations=8, n_records=2500, page_size=1000):
+    """
+    Station records retrieved in one request per station by the owslib client, against the paged retrieval
+    of eight workers to the station csv files and to the station store, with injected faults
+    """
+    records = synthetic_features(n_stations, n_records)
+    stations = [station for collection, station in records]
+    n_pages = -(-n_records // page_size)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        serial_dir, parallel_dir, store_dir = Path(tmp_dir, 'serial'), Path(tmp_dir, 'parallel'), Path(tmp_dir, 'store')
+
+        with MockFeatures(records) as mock:
+            retrieve_data_from_api(stations, 'hydrometric-realtime', 'DISCHARGE', 'DATETIME', mock.url, serial_dir, limit=n_records)
+
+        for output_store_dir in [None, store_dir]:
+            with MockFeatures(records, faults=FAULTS, fault_delay=FAULT_DELAY) as mock:
+                retrieve_data_from_api_parallel(stations, 'hydrometric-realtime', 'DISCHARGE', 'DATETIME', mock.url, parallel_dir,
+                                                page_size=page_size, max_workers=8, store_dir=output_store_dir,
+                                                max_retries=3, retry_backoff=0.1, timeout=TIMEOUT)
+                if mock.injected_faults != len(FAULTS) * n_stations * n_pages:
+                    raise AssertionError(f'{mock.injected_faults} faults injected, {len(FAULTS) * n_stations * n_pages} expected')
+
+        stored_df = read_station_data(store_dir, 'hydrometric-realtime', 'DISCHARGE')
+        for station in stations:
+            serial_df = read_station_csv(Path(serial_dir, 'hydrometric-realtime', f'{station}_DISCHARGE.csv'), 'DATETIME')
+            parallel_df = read_station_csv(Path(parallel_dir, 'hydrometric-realtime', f'{station}_DISCHARGE.csv'), 'DATETIME')
+            station_stored_df = compact_station_frame(stored_df[stored_df['STATION_NUMBER'] == station].assign(STATION_NUMBER=station))
+            pd.testing.assert_frame_equal(serial_df, parallel_df)
+            pd.testing.assert_frame_equal(serial_df, station_stored_df[serial_df.columns], check_categorical=False)
+
+    print(f'features_fetch: {n_stations} stations x {n_pages} pages, {len(FAULTS) * n_stations * n_pages} injected faults '
+          f'recovered for the csv files and the station store, identical to the serial retrieval')
+
+def main():
+    check_wcs_fetch()
+    check_features_fetch()
+
+if __name__ == '__main__':
+    main()
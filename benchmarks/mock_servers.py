@@ -0,0 +1,227 @@
+# Description: Local mock GeoMet (WMS/WCS) and OGC API Features servers, serving recorded or synthetic fixtures
+# so the fetchers can be benchmarked without network access. Server errors and timeouts can be injected
+# into the data requests, to check the retries of the fetchers.
+import collections
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+WCS_CAPABILITIES = '''<?xml version="1.0" encoding="UTF-8"?>
+<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0" xmlns:ows="http://www.opengis.net/ows/2.0" xmlns:xlink="http://www.w3.org/1999/xlink" version="2.0.1">
+<ows:ServiceIdentification><ows:Title>mock</ows:Title><ows:ServiceType>OGC WCS</ows:ServiceType><ows:ServiceTypeVersion>2.0.1</ows:ServiceTypeVersion></ows:ServiceIdentification>
+<ows:ServiceProvider><ows:ProviderName>mock</ows:ProviderName><ows:ServiceContact><ows:IndividualName>mock</ows:IndividualName></ows:ServiceContact></ows:ServiceProvider>
+<ows:OperationsMetadata>
+<ows:Operation name="GetCapabilities"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}?"/></ows:HTTP></ows:DCP></ows:Operation>
+<ows:Operation name="DescribeCoverage"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}?"/></ows:HTTP></ows:DCP></ows:Operation>
+<ows:Operation name="GetCoverage"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}?"/></ows:HTTP></ows:DCP></ows:Operation>
+</ows:OperationsMetadata>
+<wcs:Contents><wcs:CoverageSummary><wcs:CoverageId>{layer}</wcs:CoverageId></wcs:CoverageSummary></wcs:Contents>
+</wcs:Capabilities>'''
+
+WMS_CAPABILITIES = '''<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms" xmlns:xlink="http://www.w3.org/1999/xlink">
+<Service><Name>WMS</Name><Title>mock</Title></Service>
+<Capability><Request><GetCapabilities><Format>text/xml</Format><DCPType><HTTP><Get><OnlineResource xlink:href="{url}?"/></Get></HTTP></DCPType></GetCapabilities>
+<GetMap><Format>image/png</Format><DCPType><HTTP><Get><OnlineResource xlink:href="{url}?"/></Get></HTTP></DCPType></GetMap></Request>
+<Layer><Title>root</Title>
+<Layer queryable="1"><Name>{layer}</Name><Title>{layer}</Title>
+<Dimension name="time" units="ISO8601" default="{first_time}">{first_time}/{last_time}/PT1H</Dimension>
+<Dimension name="reference_time" units="ISO8601" default="{reference_time}">{reference_time}/{reference_time}/PT12H</Dimension>
+</Layer></Layer></Capability></WMS_Capabilities>'''
+
+class _MockServer:
+    """
+    Threaded http server on a free local port, counting the requests and bytes served
+
+    Args:
+    faults (list): Faults injected into the first requests of every distinct data request, in order:
+        an http status (e.g. 503) is returned instead of the response, 'timeout' delays the response by fault_delay.
+    fault_delay (float): Delay in seconds of the injected timeouts.
+    """
+    def __init__(self, faults=(), fault_delay=2.0):
+        self.requests = 0
+        self.bytes = 0
+        self.faults = list(faults)
+        self.fault_delay = fault_delay
+        self.injected_faults = 0
+        self._attempts = collections.Counter()
+        self._lock = threading.Lock()
+
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, content_type, body = mock.respond(self.path)
+                fault = mock._next_fault(self.path)
+                if fault == 'timeout':
+                    time.sleep(mock.fault_delay)
+                elif fault is not None:
+                    status, content_type, body = int(fault), 'text/plain', b'Injected server error'
+                with mock._lock:
+                    mock.requests += 1
+                    mock.bytes += len(body)
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. on an injected timeout
+                    pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def respond(self, path):
+        raise NotImplementedError
+
+    def is_data_request(self, path):
+        """
+        Whether faults can be injected into the request, all requests by default
+        """
+        return True
+
+    def _next_fault(self, path):
+        """
+        Fault injected into this attempt of the request, if any
+        """
+        if not self.faults or not self.is_data_request(path):
+            return None
+        with self._lock:
+            attempt = self._attempts[path]
+            self._attempts[path] += 1
+            if attempt >= len(self.faults):
+                return None
+            self.injected_faults += 1
+        return self.faults[attempt]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+class MockGeoMet(_MockServer):
+    """
+    GeoMet mock serving one layer: WMS capabilities with time and reference_time dimensions,
+    and WCS coverages cut from a gridded dataset with the lat/lon subsets of the request.
+
+    Args:
+    grid_ds (Dataset): Single time gridded dataset with lat and lon coordinates, e.g. gis_data/sample_analysis.nc.
+    layer_name (str): Name of the layer.
+    reference_time (str): Reference time of the layer.
+    n_lead_times (int): Number of hourly lead times of the layer.
+    faults, fault_delay: Faults injected into the coverage requests (see _MockServer).
+    """
+    def __init__(self, grid_ds, layer_name='LAYER', reference_time='2024-05-01T00:00:00Z', n_lead_times=48,
+                 faults=(), fault_delay=2.0):
+        super().__init__(faults, fault_delay)
+        self.grid_ds = grid_ds
+        self.layer_name = layer_name
+        self.reference_time = reference_time
+        times = pd.date_range(reference_time, periods=n_lead_times, freq='h')
+        self.first_time = times[0].strftime('%Y-%m-%dT%H:%M:%SZ')
+        self.last_time = times[-1].strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}/geomet'
+
+    def is_data_request(self, path):
+        return 'getcapabilities' not in path.lower()
+
+    def respond(self, path):
+        query_pairs = urllib.parse.parse_qsl(urllib.parse.urlparse(path).query)
+        query = {key.upper(): value for key, value in query_pairs}
+
+        if query.get('REQUEST', '').lower() == 'getcapabilities':
+            template = WMS_CAPABILITIES if query.get('SERVICE', '').upper() == 'WMS' else WCS_CAPABILITIES
+            body = template.format(url=self.url, layer=self.layer_name, first_time=self.first_time,
+                                   last_time=self.last_time, reference_time=self.reference_time)
+            return 200, 'text/xml', body.encode()
+
+        coverage = self.grid_ds
+        for key, value in query_pairs:
+            if key.lower() != 'subset':
+                continue
+            match = re.match(r'(\w+)\(([-\d.]+),([-\d.]+)\)', value)
+            coverage = coverage.sel({match[1]: slice(float(match[2]), float(match[3]))})
+
+        return 200, 'application/x-netcdf', coverage.to_netcdf()
+
+class MockFeatures(_MockServer):
+    """
+    OGC API Features mock serving the items of station collections, with limit/offset paging,
+    next links and open-ended time filters, and an empty landing page.
+
+    Args:
+    records (dict): List of item properties for each (collection, station).
+    datetime_column (str): Property used by the time filter.
+    faults, fault_delay: Faults injected into the item requests (see _MockServer).
+    """
+    def __init__(self, records, datetime_column='DATETIME', faults=(), fault_delay=2.0):
+        super().__init__(faults, fault_delay)
+        self.records = records
+        self.datetime_column = datetime_column
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}/'
+
+    def respond(self, path):
+        parsed = urllib.parse.urlparse(path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        if not parsed.path.startswith('/collections/'):
+            # Landing page, requested by the owslib client
+            return 200, 'application/json', json.dumps({'links': []}).encode()
+        collection = parsed.path.split('/')[2]
+        limit = int(query.get('limit', 10))
+        offset = int(query.get('offset', 0))
+
+        rows = self.records.get((collection, query.get('STATION_NUMBER')), [])
+        if 'time' in query:
+            start = query['time'].split('/')[0]
+            rows = [row for row in rows if row[self.datetime_column] >= start]
+
+        links = []
+        if offset + limit < len(rows):
+            next_query = urllib.parse.urlencode({**query, 'offset': offset + limit})
+            links.append({'rel': 'next', 'href': f'http://127.0.0.1:{self.port}{parsed.path}?{next_query}'})
+
+        page = {'type': 'FeatureCollection', 'features': [{'properties': row} for row in rows[offset:offset + limit]],
+                'links': links}
+
+        return 200, 'application/json', json.dumps(page).encode()
+
+def synthetic_features(n_stations, n_records, collection='hydrometric-realtime', seed=42):
+    """
+    Items of a realtime collection for the mock OGC API, n_records 5 minute records per station
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2024-05-01', periods=n_records, freq='5min').strftime('%Y-%m-%dT%H:%M:%SZ').tolist()
+
+    records = {}
+    for i in range(n_stations):
+        station = f'05XX{i:04d}'
+        discharge = rng.uniform(10, 500, n_records).round(3).tolist()
+        records[(collection, station)] = [{'STATION_NUMBER': station, 'STATION_NAME': f'SYNTHETIC RIVER {i:04d}',
+                                           'DATETIME': time_, 'DISCHARGE': value}
+                                          for time_, value in zip(times, discharge)]
+
+    return records
@@ -0,0 +1,319 @@
+# Description: Benchmark harness timing each processing step, and measuring its peak memory, as the number of
+# stations and the record length grow. The fetchers are run against local mock GeoMet and OGC API servers.
+#
+# Usage: python benchmarks/run_benchmarks.py [--cases extraction,bias_correction] [--quick]
+#                                            [--output results.json] [--baseline results.json --tolerance 1.5]
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from forecast_flood_impact.calculate_return_periods import calculate_return_periods, classify_return_periods
+from forecast_flood_impact.hydrograph_plotting import calculate_daily_percentiles_of_historic_data, calculate_daily_percentiles_for_stations
+from forecast_flood_impact.nsrps_data_access import (extract_station_from_grid, build_station_grid_index, extract_stations_from_grid,
+                               bias_correct_forecast, bias_correct_forecasts, station_windows,
+                               query_wms_service_for_forecast_times, query_wcs_service_for_forecast_data)
+from forecast_flood_impact.scalar_data_access import retrieve_data_from_api_parallel
+from benchmark_return_periods import synthetic_discharge, calculate_return_periods_iterrows
+from mock_servers import MockGeoMet, MockFeatures, synthetic_features
+
+logger = logging.getLogger(__name__)
+
+repo_dir = Path(__file__).resolve().parents[1]
+threshold_csv = repo_dir / 'flood_frequency_analysis' / 'ffa_summary_for_tool.csv'
+annual_data_dir = repo_dir / 'flood_frequency_analysis' / 'historic_annual_data'
+sample_grid_nc = repo_dir / 'gis_data' / 'sample_analysis.nc'
+
+MOCK_LOGIN = {'Username': None, 'Password': None}
+
+def synthetic_stations(grid_ds, n_stations, seed=42):
+    """
+    Station locations (as in nsrps_stn_locations.csv) spread over the grid
+    """
+    rng = np.random.default_rng(seed)
+    lat, lon = grid_ds['lat'].values, grid_ds['lon'].values
+
+    return pd.DataFrame({'STATION_NUMBER': [f'05XX{i:04d}' for i in range(n_stations)],
+                         'MODEL_LATITUDE': rng.uniform(lat.min() + 0.05, lat.max() - 0.05, n_stations).round(6),
+                         'MODEL_LONGITUDE': rng.uniform(lon.min() + 0.05, lon.max() - 0.05, n_stations).round(6)})
+
+def synthetic_historic_daily(n_stations, n_years, seed=42):
+    """
+    Long format daily historic discharge (as in hydrometric-daily-mean), shaped by the recorded annual maxima
+    of flood_frequency_analysis/historic_annual_data: each year peaks at its annual maximum in early summer.
+    """
+    rng = np.random.default_rng(seed)
+    annual_maxima = [pd.read_csv(csv_path, encoding='utf-8-sig')['max'].dropna().to_numpy()
+                     for csv_path in sorted(annual_data_dir.glob('*.csv'))]
+
+    dates = pd.date_range(f'{2023 - n_years}-01-01', '2022-12-31', freq='D')
+    year_index = dates.year - dates.year[0]
+    # Snowmelt hydrograph, peaking mid June
+    seasonal = np.exp(-0.5 * ((dates.dayofyear.to_numpy() - 170) / 30) ** 2) * 0.9 + 0.1
+
+    frames = []
+    for i in range(n_stations):
+        maxima = np.resize(annual_maxima[i % len(annual_maxima)], n_years)
+        discharge = maxima[year_index] * seasonal * rng.uniform(0.8, 1.0, len(dates))
+        frames.append(pd.DataFrame({'DATE': dates, 'STATION_NUMBER': f'05XX{i:04d}', 'DISCHARGE': discharge}))
+
+    return pd.concat(frames, ignore_index=True)
+
+def synthetic_grid(n_steps):
+    """
+    Hourly gridded forecast of n_steps lead times, repeating gis_data/sample_analysis.nc
+    """
+    with xr.open_dataset(sample_grid_nc) as sample_ds:
+        grid = sample_ds['Band1'].isel(time=0, drop=True).load()
+
+    times = pd.date_range('2024-05-01', periods=n_steps, freq='h')
+    scale = xr.DataArray(np.linspace(0.5, 1.5, n_steps, dtype='float32'), dims='time', coords={'time': times})
+
+    return (grid * scale).to_dataset(name='Band1').transpose('time', 'lat', 'lon')
+
+def synthetic_measurements(stations, n_steps, seed=42):
+    """
+    Long format realtime (5 minute) discharge of each station, ending inside the forecast period
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end='2024-05-01 06:00', periods=n_steps, freq='5min', name='DATETIME')
+
+    return pd.concat([pd.DataFrame({'STATION_NUMBER': station, 'DISCHARGE': rng.uniform(10, 500, n_steps)}, index=index)
+                      for station in stations])
+
+# Each case prepares its fixtures for a number of stations and a record length, and returns the call to measure
+# (and the mock server, if any). Fixtures are built outside of the measurement.
+
+def case_classification(n_stations, n_steps):
+    threshold_df = pd.read_csv(threshold_csv)
+    discharge_df, thresholds = synthetic_discharge(threshold_df, n_stations, n_steps)
+    return lambda: classify_return_periods(discharge_df, thresholds), None
+
+def case_classification_per_station(n_stations, n_steps):
+    threshold_df = pd.read_csv(threshold_csv)
+    discharge_df, thresholds = synthetic_discharge(threshold_df, n_stations, n_steps)
+    realtime_df, forecast_df = discharge_df.iloc[:0], discharge_df
+    stations = discharge_df['STATION_NUMBER'].unique()
+    return lambda: [calculate_return_periods(realtime_df, forecast_df, thresholds, station) for station in stations], None
+
+def case_classification_original(n_stations, n_steps):
+    threshold_df = pd.read_csv(threshold_csv)
+    discharge_df, thresholds = synthetic_discharge(threshold_df, n_stations, n_steps)
+    realtime_df, forecast_df = discharge_df.iloc[:0], discharge_df
+    stations = discharge_df['STATION_NUMBER'].unique()
+    return lambda: [calculate_return_periods_iterrows(realtime_df, forecast_df, thresholds, station) for station in stations], None
+
+def case_climatology_per_station(n_stations, n_years):
+    historic_df = synthetic_historic_daily(n_stations, n_years)
+    station_dfs = [station_df for station, station_df in historic_df.groupby('STATION_NUMBER')]
+    return lambda: [calculate_daily_percentiles_of_historic_data(station_df, 'DISCHARGE') for station_df in station_dfs], None
+
+def case_climatology(n_stations, n_years):
+    historic_df = synthetic_historic_daily(n_stations, n_years)
+    return lambda: calculate_daily_percentiles_for_stations(historic_df, 'DISCHARGE'), None
+
+def case_extraction_per_station(n_stations, n_steps):
+    grid_ds = synthetic_grid(n_steps)
+    stations_df = synthetic_stations(grid_ds, n_stations)
+    return lambda: [extract_station_from_grid(station, grid_ds).load() for station in stations_df.iterrows()], None
+
+def case_extraction(n_stations, n_steps):
+    grid_ds = synthetic_grid(n_steps)
+    stations_df = synthetic_stations(grid_ds, n_stations)
+    return lambda: extract_stations_from_grid(build_station_grid_index(stations_df, grid_ds), grid_ds).load(), None
+
+def _bias_correction_inputs(n_stations, n_steps, n_lead_times=240):
+    stations = [f'05XX{i:04d}' for i in range(n_stations)]
+    measurements = synthetic_measurements(stations, n_steps)
+    times = pd.date_range('2024-05-01', periods=n_lead_times, freq='h')
+    values = np.random.default_rng(0).uniform(10, 500, (n_lead_times, n_stations))
+    forecast = xr.DataArray(values, dims=('time', 'station'), coords={'time': times, 'station': stations})
+    return stations, measurements, forecast
+
+def case_bias_correction_per_station(n_stations, n_steps):
+    stations, measurements, forecast = _bias_correction_inputs(n_stations, n_steps)
+    station_measurements = {station: station_df for station, station_df in measurements.groupby('STATION_NUMBER')}
+    station_forecasts = {station: forecast.sel(station=station).to_series().to_frame('Discharge') for station in stations}
+    return lambda: [bias_correct_forecast(station_measurements[station], station_forecasts[station].copy())
+                    for station in stations], None
+
+def case_bias_correction(n_stations, n_steps):
+    stations, measurements, forecast = _bias_correction_inputs(n_stations, n_steps)
+    return lambda: bias_correct_forecasts(measurements, forecast), None
+
+def case_wcs_fetch(n_stations, n_lead_times):
+    with xr.open_dataset(sample_grid_nc) as sample_ds:
+        grid_ds = sample_ds.isel(time=0, drop=True).load()
+    stations_df = synthetic_stations(grid_ds, n_stations)
+    mock = MockGeoMet(grid_ds, n_lead_times=n_lead_times).__enter__()
+    newest_fcast, fcasthrs = query_wms_service_for_forecast_times(mock.layer_name, MOCK_LOGIN, geomet_url=mock.url)
+    windows = station_windows(stations_df)
+
+    def fetch():
+        return query_wcs_service_for_forecast_data(mock.layer_name, MOCK_LOGIN, newest_fcast, fcasthrs, geomet_url=mock.url,
+                                                   tiles=windows, stations_df=stations_df)
+
+    return fetch, mock
+
+def case_features_fetch(n_stations, n_records):
+    records = synthetic_features(n_stations, n_records)
+    stations = [station for collection, station in records]
+    output_dir = tempfile.mkdtemp(prefix='benchmark_features_')
+    mock = MockFeatures(records).__enter__()
+
+    def fetch():
+        return retrieve_data_from_api_parallel(stations, 'hydrometric-realtime', 'DISCHARGE', 'DATETIME', mock.url,
+                                               output_dir, page_size=1000)
+
+    return fetch, mock
+
+# Case: (function, station counts, record lengths, unit of the record length)
+CASES = {
+    'classification': (case_classification, [10, 100, 1000], [2016, 8064], '5 min steps'),
+    'classification_per_station': (case_classification_per_station, [10, 100], [2016, 8064], '5 min steps'),
+    # The original row by row classification, the baseline of the cases above at their smallest scale
+    'classification_original': (case_classification_original, [10], [2016], '5 min steps'),
+    'climatology': (case_climatology, [5, 50, 200], [30, 120], 'years'),
+    'climatology_per_station': (case_climatology_per_station, [5, 50], [30, 120], 'years'),
+    'extraction': (case_extraction, [10, 100, 1000], [24, 240], 'hourly lead times'),
+    'extraction_per_station': (case_extraction_per_station, [10, 100, 1000], [24, 240], 'hourly lead times'),
+    'bias_correction': (case_bias_correction, [10, 100, 1000], [2016, 8064], '5 min measurements'),
+    'bias_correction_per_station': (case_bias_correction_per_station, [10, 100, 1000], [2016, 8064], '5 min measurements'),
+    'wcs_fetch': (case_wcs_fetch, [10, 100], [6, 24], 'hourly lead times'),
+    'features_fetch': (case_features_fetch, [10, 50], [1000, 5000], 'records per station'),
+}
+
+def measure(call, repeat=3):
+    """
+    Best wall time of repeat calls, and the peak of the memory allocated by one more call under tracemalloc.
+    The time is measured without tracemalloc, which slows down the allocations it traces.
+    """
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        call()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(seconds), peak
+
+def run_benchmarks(cases, quick=False, repeat=3):
+    """
+    Run the benchmark cases for each number of stations and record length.
+
+    Args:
+    cases (list): Names of the CASES to run.
+    quick (bool): Only run the smallest station count and record length of each case.
+    repeat (int): Number of timed calls of each case, the best time is kept.
+
+    Returns:
+    list: A result dict per case and scale.
+    """
+    results = []
+    for name in cases:
+        case, station_counts, lengths, length_unit = CASES[name]
+        if quick:
+            station_counts, lengths = station_counts[:1], lengths[:1]
+
+        for n_stations in station_counts:
+            for length in lengths:
+                call, mock = case(n_stations, length)
+                try:
+                    seconds, peak = measure(call, repeat)
+                    # The fetchers are called repeat + 1 times
+                    n_requests = mock.requests / (repeat + 1) if mock is not None else None
+                    mb_served = mock.bytes / (repeat + 1) / 1e6 if mock is not None else None
+                finally:
+                    if mock is not None:
+                        mock.__exit__(None, None, None)
+
+                result = {'case': name, 'stations': n_stations, 'length': length, 'length_unit': length_unit,
+                          'seconds': seconds, 'peak_mb': peak / 1e6, 'requests': n_requests, 'mb_served': mb_served}
+                results.append(result)
+                print(format_result(result), flush=True)
+
+    return results
+
+def format_result(result, regression=''):
+    served = f"{result['requests']:8.0f} {result['mb_served']:9.2f}" if result['requests'] is not None else f"{'':8} {'':9}"
+    return (f"{result['case']:28} {result['stations']:8d} {result['length']:8d} {result['seconds']:10.4f} "
+            f"{result['peak_mb']:9.2f} {served} {regression}")
+
+def compare_to_baseline(results, baseline, tolerance=1.5):
+    """
+    Cases slower, or with a higher peak memory, than tolerance times the baseline results of the same scale
+    """
+    baseline_results = {(result['case'], result['stations'], result['length']): result for result in baseline['results']}
+
+    regressions = []
+    for result in results:
+        reference = baseline_results.get((result['case'], result['stations'], result['length']))
+        if reference is None:
+            continue
+        for metric in ['seconds', 'peak_mb']:
+            if result[metric] > tolerance * reference[metric]:
+                regressions.append(f"{result['case']} ({result['stations']} stations, {result['length']}): "
+                                   f"{metric} {result[metric]:.4g} against {reference[metric]:.4g}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the processing steps and measure their peak memory as the '
+                                                 'number of stations and the record length grow.')
+    parser.add_argument('--cases', default=','.join(CASES), help=f'Comma separated cases to run. Default: {",".join(CASES)}')
+    parser.add_argument('--quick', action='store_true', help='Only run the smallest scale of each case.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed calls of each case.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Ratio to the baseline above which a case is reported as a regression.')
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    unknown_cases = [case for case in cases if case not in CASES]
+    if unknown_cases:
+        parser.error(f'Unknown cases: {unknown_cases}')
+
+    # The fetchers log every request, the synthetic thresholds are built one station column at a time
+    # and the original classification sets its class labels in a float column
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    print(f"{'case':28} {'stations':>8} {'length':>8} {'seconds':>10} {'peak MB':>9} {'requests':>8} {'MB served':>9}")
+    results = run_benchmarks(cases, args.quick, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'created': datetime.now(timezone.utc).isoformat(), 'results': results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
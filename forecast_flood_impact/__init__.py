@@ -0,0 +1,3 @@
+# Description: Forecast Flood Impact: access to the NSRPS forecasts and the hydrometric observations, return period
+# classification, alerts and rendering of the stations. The modules are imported from the package, e.g.
+#   from forecast_flood_impact.calculate_return_periods import calculate_return_periods
@@ -0,0 +1,348 @@
+# Description: Incremental return period alerting. New realtime observations and bias-corrected forecast steps are
+# classified as they arrive, and only the class transitions of each station are emitted to a sink (JSONL file or webhook).
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .bias_correction import LOCAL_TIME_ZONE
+from .calculate_return_periods import BELOW_LOWEST_THRESHOLD
+from .threshold_registry import as_threshold_registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Times of the station state, stored as ISO strings in the state file
+STATE_TIMES = ['last_observed_time', 'first_exceedance_time', 'forecast_reference', 'last_forecast_time', 'forecast_peak_time']
+
+def _local_times(times):
+    """
+    Times as naive datetime64 in the local time of the NSRPS forecasts, as in the outputs of the workflow
+    """
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert(LOCAL_TIME_ZONE).tz_localize(None)
+    return times.to_numpy(dtype='datetime64[ns]')
+
+def _iso(time_):
+    return None if time_ is None or pd.isna(time_) else pd.Timestamp(time_).isoformat()
+
+class JsonlAlertSink:
+    """
+    Append the alerts to a JSON lines file, one alert per line
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def emit(self, alerts):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as f:
+            for alert in alerts:
+                f.write(json.dumps(alert) + '\n')
+
+class WebhookAlertSink:
+    """
+    Post the alerts of each update as one JSON request ({"alerts": [...]}) to a webhook
+    """
+    def __init__(self, url, timeout=10):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def emit(self, alerts):
+        response = self.session.post(self.url, json={'alerts': alerts}, timeout=self.timeout)
+        response.raise_for_status()
+
+class AlertEngine:
+    """
+    Per-station alert state updated incrementally from new observations and forecast steps.
+
+    The state of each station holds its current (observed) class, the time of the first exceedance of the lowest
+    threshold in the ongoing event, and the peak of the current forecast cycle with its class and time. An update
+    only classifies the new rows, so its cost is in the order of the number of new rows, whatever the length of the
+    records. Only the class transitions are emitted to the sink. If the sink fails, the state of the stations of the
+    update is restored, so the same rows are evaluated and the alerts emitted again on the next update.
+
+    Classes are the number of exceeded thresholds (0 below the lowest), reported in the alerts as in the Exceedance
+    column of classify_return_periods: BELOW_LOWEST_THRESHOLD or the largest exceeded T_yrs. Stations seen for the
+    first time start below the lowest threshold, so only their exceedances are reported.
+
+    Args:
+    thresholds (ThresholdRegistry or DataFrame): Threshold registry, or a threshold table as in ffa_summary_for_tool.csv.
+    sink: Object with an emit(alerts) method, e.g. JsonlAlertSink or WebhookAlertSink.
+    state (dict): Optional state of the stations, as saved by save_state.
+    """
+    def __init__(self, thresholds, sink, state=None):
+        self.registry = as_threshold_registry(thresholds)
+        self.sink = sink
+        self.state = {}
+        self._unknown_stations = set()
+        for station, station_state in (state or {}).items():
+            # The state of stations whose thresholds were removed is dropped
+            if not self._has_thresholds(station):
+                continue
+            self.state[station] = {**station_state, **{key: None if station_state.get(key) is None else pd.Timestamp(station_state[key])
+                                                       for key in STATE_TIMES}}
+
+    @classmethod
+    def load(cls, state_path, thresholds, sink):
+        """
+        Engine with the station state saved in a JSON file, if it exists
+        """
+        state = None
+        if Path(state_path).exists():
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        return cls(thresholds, sink, state)
+
+    def save_state(self, state_path):
+        Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+        state = {station: {**station_state, **{key: _iso(station_state[key]) for key in STATE_TIMES}}
+                 for station, station_state in self.state.items()}
+        with open(state_path, 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def _has_thresholds(self, station):
+        """
+        Whether alerts can be evaluated for a station, warning once for each station without thresholds
+        """
+        if station in self.registry:
+            return True
+        if station not in self._unknown_stations:
+            logger.warning(f'No thresholds available for station {station}, no alerts are evaluated')
+            self._unknown_stations.add(station)
+        return False
+
+    def _station(self, station):
+        if station not in self.registry:
+            raise KeyError(f'No thresholds available for station {station}')
+        if station not in self.state:
+            self.state[station] = {'class': 0, 'last_observed_time': None, 'first_exceedance_time': None,
+                                   'forecast_class': 0, 'forecast_reference': None, 'last_forecast_time': None,
+                                   'forecast_peak': None, 'forecast_peak_time': None}
+        return self.state[station]
+
+    def _class_label(self, code):
+        return BELOW_LOWEST_THRESHOLD if code == 0 else self.registry.t_yrs[code - 1].item()
+
+    def _time_to_peak_hours(self, station_state):
+        """
+        Hours from the last observation (or the forecast reference time) to the forecast peak, negative once passed
+        """
+        if station_state['forecast_peak_time'] is None:
+            return None
+        start = station_state['last_observed_time'] or station_state['forecast_reference']
+        return (station_state['forecast_peak_time'] - start) / pd.Timedelta(hours=1)
+
+    def station_summary(self, station):
+        """
+        Current alert state of a station, with the time to the forecast peak.
+        Raises a KeyError for a station without thresholds.
+        """
+        station_state = self._station(station)
+        return {'station': station,
+                'class': self._class_label(station_state['class']),
+                'first_exceedance_time': _iso(station_state['first_exceedance_time']),
+                'last_observed_time': _iso(station_state['last_observed_time']),
+                'forecast_class': self._class_label(station_state['forecast_class']),
+                'forecast_peak': station_state['forecast_peak'],
+                'forecast_peak_time': _iso(station_state['forecast_peak_time']),
+                'time_to_peak_hours': self._time_to_peak_hours(station_state)}
+
+    def _alert(self, station, source, time_, previous_code, code, discharge):
+        alert = self.station_summary(station)
+        alert.update({'source': source, 'time': _iso(time_), 'previous_class': self._class_label(previous_code),
+                      'class': self._class_label(code), 'discharge': float(discharge),
+                      'return_period': float(self.registry.return_period(station, float(discharge))),
+                      'emitted': datetime.now(timezone.utc).isoformat()})
+        return alert
+
+    def _new_rows(self, df, station_column, discharge_column):
+        """
+        Local times, stations and values of the rows with a value, for the stations with thresholds,
+        with the unique stations with thresholds and the index of the station of each row.
+        Stations without thresholds are left out, so no state is kept for them.
+        """
+        times = _local_times(df.index)
+        stations = df[station_column].to_numpy(dtype=object)
+        values = df[discharge_column].to_numpy(dtype=float)
+
+        unique_stations, inverse = np.unique(stations, return_inverse=True)
+        known = np.array([self._has_thresholds(station) for station in unique_stations], dtype=bool)
+        keep = known[inverse] & ~np.isnan(values)
+        known_index = np.cumsum(known) - 1
+
+        return times[keep], stations[keep], values[keep], unique_stations[known], known_index[inverse[keep]]
+
+    def _snapshot(self, stations):
+        return {station: dict(self.state[station]) if station in self.state else None for station in stations}
+
+    def _emit(self, alerts, snapshot):
+        if not alerts:
+            return
+        try:
+            self.sink.emit(alerts)
+        except Exception:
+            for station, station_state in snapshot.items():
+                if station_state is None:
+                    self.state.pop(station, None)
+                else:
+                    self.state[station] = station_state
+            raise
+
+    def update_observations(self, observations_df, station_column='STATION_NUMBER', discharge_column='DISCHARGE'):
+        """
+        Classify the observations newer than the last one of their station, and emit the class transitions.
+
+        Rows at or before the last observation of their station, e.g. the overlap of an incremental query,
+        are skipped, so only the new rows are classified.
+
+        Args:
+        observations_df (DataFrame): Long format observations with a datetime index, as in hydrometric-realtime.
+
+        Returns:
+        list: The emitted alerts.
+        """
+        times, stations, values, unique_stations, inverse = self._new_rows(observations_df, station_column, discharge_column)
+        snapshot = self._snapshot(unique_stations)
+
+        last_times = pd.DatetimeIndex([self._station(station)['last_observed_time'] for station in unique_stations]).to_numpy()[inverse]
+        new = np.isnat(last_times) | (times > last_times)
+
+        # Rows of each station in time order
+        order = np.flatnonzero(new)[np.lexsort((times[new], inverse[new]))]
+        if len(order) == 0:
+            return []
+        times, stations, values, inverse = times[order], stations[order], values[order], inverse[order]
+        codes = self.registry.exceeded_counts(stations, values)
+
+        first_rows = np.r_[True, inverse[1:] != inverse[:-1]]
+        last_rows = np.r_[inverse[1:] != inverse[:-1], True]
+        previous_codes = np.r_[0, codes[:-1]]
+        previous_codes[first_rows] = [self.state[station]['class'] for station in stations[first_rows]]
+
+        alerts = []
+        for i in np.flatnonzero(codes != previous_codes):
+            station_state = self.state[stations[i]]
+            if previous_codes[i] == 0:
+                station_state['first_exceedance_time'] = pd.Timestamp(times[i])
+            elif codes[i] == 0:
+                station_state['first_exceedance_time'] = None
+            station_state['class'] = int(codes[i])
+            station_state['last_observed_time'] = pd.Timestamp(times[i])
+            alerts.append(self._alert(stations[i], 'observed', times[i], int(previous_codes[i]), int(codes[i]), values[i]))
+
+        for i in np.flatnonzero(last_rows):
+            self.state[stations[i]]['class'] = int(codes[i])
+            self.state[stations[i]]['last_observed_time'] = pd.Timestamp(times[i])
+
+        self._emit(alerts, snapshot)
+
+        return alerts
+
+    def update_forecast(self, forecast_df, reference_time, station_column='STATION_NUMBER', discharge_column='Discharge'):
+        """
+        Update the forecast peak of each station with new (bias-corrected) forecast steps, and emit the transitions
+        of the forecast class, the class of the peak.
+
+        A newer reference time starts a new forecast cycle, whose peak replaces the peak of the previous cycle.
+        Steps of older cycles, and steps at or before the last step received of the current cycle, are skipped.
+
+        Args:
+        forecast_df (DataFrame): Long format forecast steps with a datetime index.
+        reference_time (str or Timestamp): Reference time of the forecast cycle.
+
+        Returns:
+        list: The emitted alerts.
+        """
+        times, stations, values, unique_stations, inverse = self._new_rows(forecast_df, station_column, discharge_column)
+        snapshot = self._snapshot(unique_stations)
+        reference_time = pd.Timestamp(_local_times([pd.Timestamp(reference_time)])[0])
+
+        last_times = []
+        for station in unique_stations:
+            station_state = self._station(station)
+            if station_state['forecast_reference'] is None or reference_time > station_state['forecast_reference']:
+                station_state.update({'forecast_reference': reference_time, 'last_forecast_time': None,
+                                      'forecast_peak': None, 'forecast_peak_time': None})
+            # Steps of an older cycle are never newer than this
+            last_times.append(pd.Timestamp.max if reference_time < station_state['forecast_reference']
+                              else station_state['last_forecast_time'])
+        last_times = pd.DatetimeIndex(last_times).to_numpy()[inverse]
+
+        new = np.isnat(last_times) | (times > last_times)
+        if not new.any():
+            return []
+        steps = pd.DataFrame({'station': stations[new], 'time': times[new], 'value': values[new]})
+
+        # Peak and last step of each station among the new steps
+        peaks = steps.loc[steps.groupby('station', sort=False)['value'].idxmax()]
+        last_steps = steps.groupby('station', sort=False)['time'].max()
+
+        for station, time_, value in zip(peaks['station'], peaks['time'], peaks['value']):
+            station_state = self.state[station]
+            station_state['last_forecast_time'] = last_steps[station]
+            if station_state['forecast_peak'] is None or value > station_state['forecast_peak']:
+                station_state['forecast_peak'] = float(value)
+                station_state['forecast_peak_time'] = pd.Timestamp(time_)
+
+        updated = peaks['station'].to_numpy(dtype=object)
+        codes = self.registry.exceeded_counts(updated, [self.state[station]['forecast_peak'] for station in updated])
+
+        alerts = []
+        for station, code in zip(updated, codes):
+            station_state = self.state[station]
+            previous_code = station_state['forecast_class']
+            station_state['forecast_class'] = int(code)
+            if code != previous_code:
+                alerts.append(self._alert(station, 'forecast', station_state['forecast_peak_time'], previous_code, int(code),
+                                          station_state['forecast_peak']))
+
+        self._emit(alerts, snapshot)
+
+        return alerts
+
+def poll_realtime_observations(engine, stations, api_url, session=None, variable='DISCHARGE', page_size=10000, start=None):
+    """
+    Query the hydrometric-realtime records of each station since its last evaluated observation,
+    and update the alert engine with them.
+
+    Args:
+    engine (AlertEngine): The alert engine.
+    stations (list): Station numbers.
+    api_url (str): OGC API url, e.g. https://api.weather.gc.ca/.
+    start (str): Start of the query of the stations without state (ISO 8601), their complete records if None.
+
+    Returns:
+    list: The emitted alerts.
+    """
+    import requests
+    from .scalar_data_access import stream_collection_items
+
+    session = session or requests.Session()
+
+    records = []
+    for station in [station for station in stations if engine._has_thresholds(station)]:
+        last_observed_time = engine._station(station)['last_observed_time']
+        if last_observed_time is not None:
+            query_start = last_observed_time.tz_localize(LOCAL_TIME_ZONE).tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%SZ')
+        else:
+            query_start = start
+        query = {'STATION_NUMBER': station}
+        if query_start is not None:
+            query['time'] = f'{query_start}/..'
+        for features in stream_collection_items(session, api_url, 'hydrometric-realtime', page_size, **query):
+            records += [feature['properties'] for feature in features]
+
+    if not records:
+        return []
+
+    observations_df = pd.DataFrame(records, columns=['STATION_NUMBER', 'DATETIME', variable])
+    observations_df.index = pd.DatetimeIndex(pd.to_datetime(observations_df.pop('DATETIME'), format='ISO8601'), name='DATETIME')
+
+    return engine.update_observations(observations_df, discharge_column=variable)
@@ -0,0 +1,121 @@
+# Description: Archive of the NSRPS analysis cycles at the stations, backfilling every available analysis reference time
+# in parallel and appending only the missing cycles to the station store:
+#   {store_dir}/{analysis_layer}/analysis/STATION_NUMBER={station}/part-{write time}.parquet
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import xarray as xr
+
+from .nsrps_data_access import (query_wms_service_for_analysis_times, query_wcs_service_for_analysis_data, station_windows,
+                               GEOMET_URL)
+from .station_store import read_station_data, write_station_data, station_partition_dir
+from .geomet_cache import evict_coverages
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Variable of the analysis series in the station store, as converted from the {station}_analysis.csv outputs
+ANALYSIS_VARIABLE = 'analysis'
+
+def archived_analysis_times(store_dir, layer_name, stations, start=None):
+    """
+    Analysis times archived for every one of the stations with an archive, a cycle missing for any of them is not archived.
+
+    Stations without any archived cycle, e.g. stations added since the last backfill, are left out, so they do not
+    have every cycle fetched again on each backfill: they are archived from the next cycle on. Only the time column
+    of the archive is read, from start if given, so the part files holding only older cycles are skipped on their
+    statistics.
+
+    Returns:
+    DatetimeIndex: The archived analysis times.
+    """
+    stations = list(dict.fromkeys(stations))
+    archived_stations = [station for station in stations
+                         if station_partition_dir(store_dir, layer_name, ANALYSIS_VARIABLE, station).exists()]
+    if len(archived_stations) < len(stations):
+        logger.info(f'{len(stations) - len(archived_stations)} of {len(stations)} stations without archived cycles of {layer_name}')
+    if not archived_stations:
+        return pd.DatetimeIndex([])
+
+    archived_df = read_station_data(store_dir, layer_name, ANALYSIS_VARIABLE, stations=archived_stations, start=start, columns=[])
+    station_counts = archived_df.groupby(level=0)['STATION_NUMBER'].nunique()
+
+    return pd.DatetimeIndex(station_counts.index[station_counts == len(archived_stations)])
+
+def backfill_analysis_archive(layer_name, login, stations_df, store_dir, iso_format="%Y-%m-%dT%H:%M:%SZ", geomet_url=GEOMET_URL,
+                              max_workers=8, tiles=None, cache_dir=None, max_cache_bytes=None, capabilities_ttl=300):
+    """
+    Fetch every available analysis cycle missing from the archive, several cycles at a time, and append them
+    to the analysis series of each station.
+
+    Each cycle is reduced to the stations as it is fetched (see query_wcs_service_for_analysis_data), so only the
+    windows around the stations are downloaded. Cycles that could not be fetched are left for the next backfill.
+
+    Args:
+    layer_name (str): Name of the analysis layer.
+    login (dict): Username and Password for the GeoMet services.
+    stations_df (DataFrame): Station locations (nsrps_stn_locations.csv).
+    store_dir (str or Path): Root directory of the station store.
+    max_workers (int): Maximum number of cycles fetched concurrently.
+    tiles (list): Optional WCS subsets requested for each cycle, the station_windows of stations_df if None.
+    cache_dir (str or Path): Optional cache directory of the capabilities and coverages.
+
+    Returns:
+    list: The analysis times appended to the archive.
+    """
+    stations = stations_df['STATION_NUMBER'].tolist()
+    tiles = tiles if tiles is not None else station_windows(stations_df)
+
+    available = query_wms_service_for_analysis_times(layer_name, login, iso_format, geomet_url, cache_dir, capabilities_ttl,
+                                                     all_times=True)
+    if not available:
+        return []
+    # Only the archived cycles still available are read
+    archived = archived_analysis_times(store_dir, layer_name, stations,
+                                       start=min(datetime.strptime(time_, iso_format) for time_ in available))
+    missing = [time_ for time_ in available if datetime.strptime(time_, iso_format) not in archived]
+    logger.info(f'{len(missing)} of {len(available)} analysis cycles of {layer_name} missing from the archive')
+    if not missing:
+        return []
+
+    def fetch_cycle(analysis_time):
+        try:
+            # The cache is evicted once all the cycles are fetched
+            return query_wcs_service_for_analysis_data(layer_name, login, analysis_time, iso_format, geomet_url, cache_dir,
+                                                       tiles=tiles, max_workers=1, stations_df=stations_df)
+        except Exception as e:
+            logger.warning(f'Analysis cycle {analysis_time} of {layer_name} could not be fetched: {e}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        cycles = [ds for ds in executor.map(fetch_cycle, missing) if ds is not None]
+    if cache_dir is not None and max_cache_bytes is not None:
+        evict_coverages(cache_dir, max_cache_bytes)
+
+    if not cycles:
+        return []
+
+    analysis = xr.concat(cycles, dim='time').sortby('time')['Band1']
+
+    # One append per station, whatever the number of cycles backfilled
+    for station in analysis['station'].values:
+        station_df = analysis.sel(station=station).to_series().to_frame('Discharge')
+        write_station_data(station_df, store_dir, layer_name, ANALYSIS_VARIABLE, station, append=True)
+
+    appended = pd.DatetimeIndex(analysis['time'].values)
+    logger.info(f'{len(appended)} analysis cycles of {layer_name} appended for {analysis.sizes["station"]} stations')
+
+    return list(appended)
+
+def read_analysis_series(store_dir, layer_name, stations=None, start=None, end=None):
+    """
+    Analysis series of the stations from the archive, in one read of the station store.
+
+    Returns:
+    DataFrame: The analysed discharge, indexed by analysis time with a column per station.
+    """
+    analysis_df = read_station_data(store_dir, layer_name, ANALYSIS_VARIABLE, stations, start, end, columns=['Discharge'])
+
+    return analysis_df.set_index('STATION_NUMBER', append=True)['Discharge'].unstack().sort_index()
@@ -0,0 +1,193 @@
+# Description: This script contains functions to render the hydrographs of all stations headless, across a process pool.
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+from matplotlib.figure import Figure
+import pandas as pd
+
+from .hydrograph_plotting import prepare_hydrograph_data, draw_annual_hydrograph_statistics
+from .bias_correction import bias_correct_forecast, LOCAL_TIME_ZONE
+from .scalar_data_access import read_station_csv, compact_station_frame
+from .threshold_registry import load_threshold_registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Figure reused between the renders of a worker process
+_figure_template = None
+
+def _init_render_worker():
+    """
+    Use the non-interactive Agg backend in the render processes
+    """
+    matplotlib.use('Agg')
+
+def _get_figure_template():
+    """
+    Cleared figure of the worker process, created on first use
+    """
+    global _figure_template
+    if _figure_template is None:
+        _figure_template = Figure(figsize=(15, 10))
+    else:
+        _figure_template.clear()
+
+    return _figure_template
+
+def _inputs_hash(input_paths, render_settings):
+    """
+    Hash of the content of the input files (or of the part files of the station store partitions) and the render settings of a station
+    """
+    inputs_hash = hashlib.sha1(repr(render_settings).encode())
+    for name, path in sorted(input_paths.items()):
+        inputs_hash.update(name.encode())
+        if path is not None:
+            for part in (sorted(Path(path).glob('*.parquet')) if Path(path).is_dir() else [Path(path)]):
+                inputs_hash.update(part.read_bytes())
+
+    return inputs_hash.hexdigest()
+
+def _read_station_input(path, datetime_column, index=False):
+    """
+    Series of a station from its csv file or its station store partition, with the datetimes as index or as a column
+    """
+    if Path(path).is_dir():
+        from .station_store import read_station_partition
+        df = read_station_partition(path)
+        return df if index else df.reset_index()
+
+    return pd.read_csv(path, index_col=datetime_column if index else None, parse_dates=index)
+
+def station_input_paths(station_number, output_base_dir, variable='DISCHARGE', threshold_csv=None, store_dir=None,
+                        forecast_layer='DHPS_1km_RiverDischarge', analysis_layer='DHPS-Analysis_1km_RiverDischarge'):
+    """
+    Paths of the workflow outputs used in the hydrograph of a station, None for the optional outputs that don't exist.
+    With store_dir, the station series are the partitions of the station in the station store instead of csv files.
+    The forecasts and analyses are those extracted from the forecast_layer and analysis_layer (geomet_settings).
+    """
+    series = {
+        'historic': ('hydrometric-daily-mean', variable),
+        'realtime': ('hydrometric-realtime', variable),
+        'forecast': (forecast_layer, 'forecast'),
+        'forecast_bias_corrected': (forecast_layer, 'forecast_bias_corrected'),
+        'analysis': (analysis_layer, 'analysis'),
+    }
+    if store_dir is not None:
+        from .station_store import station_partition_dir
+        input_paths = {name: station_partition_dir(store_dir, collection, series_variable, station_number)
+                       for name, (collection, series_variable) in series.items()}
+    else:
+        input_paths = {name: Path(output_base_dir, collection, f'{station_number}_{series_variable}.csv')
+                       for name, (collection, series_variable) in series.items()}
+    input_paths['thresholds'] = Path(threshold_csv) if threshold_csv is not None else None
+
+    for name in ['forecast', 'forecast_bias_corrected', 'analysis', 'thresholds']:
+        if input_paths[name] is not None and not input_paths[name].exists():
+            input_paths[name] = None
+
+    return input_paths
+
+def render_station_hydrograph(station_number, variable, input_paths, output_dir, formats=('png',), bias_correct=True,
+                              climatology_cache_dir=None, force=False, ffa_dir=None):
+    """
+    Render the two panel hydrograph of a station to file, unless its inputs are unchanged since the last render.
+    The thresholds are read with the fitted quantiles of the flood frequency analyses of ffa_dir, if given.
+
+    Returns:
+    dict: The station, its status (rendered, unchanged or failed) and the files written.
+    """
+    output_paths = [Path(output_dir, f'{station_number}_{variable}_hydrograph.{fmt}') for fmt in formats]
+    hash_path = Path(output_dir, f'.{station_number}_{variable}_hydrograph.sha1')
+
+    try:
+        inputs_hash = _inputs_hash(input_paths, (variable, bias_correct, tuple(formats), str(ffa_dir)))
+        if not force and hash_path.exists() and hash_path.read_text() == inputs_hash and all(path.exists() for path in output_paths):
+            return {'station': station_number, 'status': 'unchanged', 'files': [str(path) for path in output_paths]}
+
+        historic_df = _read_station_input(input_paths['historic'], 'DATE')
+        if input_paths['realtime'].is_dir():
+            realtime_df = compact_station_frame(_read_station_input(input_paths['realtime'], 'DATETIME', index=True))
+        else:
+            realtime_df = read_station_csv(input_paths['realtime'], 'DATETIME')
+        forecast_df = _read_station_input(input_paths['forecast'], 'time', index=True) if input_paths['forecast'] is not None else None
+        analysis_df = _read_station_input(input_paths['analysis'], 'time') if input_paths['analysis'] is not None else None
+        # The thresholds are loaded once per worker process
+        threshold_registry = load_threshold_registry(input_paths['thresholds'], ffa_dir) if input_paths['thresholds'] is not None else None
+        if threshold_registry is not None and station_number not in threshold_registry:
+            threshold_registry = None
+
+        # The bias corrected forecast of the pipeline is used when available
+        forecast_bias_corrected_df = None
+        if bias_correct and input_paths.get('forecast_bias_corrected') is not None:
+            forecast_bias_corrected_df = _read_station_input(input_paths['forecast_bias_corrected'], 'time')
+        elif bias_correct and forecast_df is not None:
+            # The measurements are matched to the forecast on its local time axis
+            measurements = realtime_df
+            if measurements.index.tz is not None:
+                measurements = measurements.set_axis(measurements.index.tz_convert(LOCAL_TIME_ZONE).tz_localize(None))
+            forecast_bias_corrected_df = bias_correct_forecast(measurements, forecast_df)
+
+        historic_range_df, realtime_daily_df, forecast_daily_df, analysis_daily_df, forecast_bias_corrected_daily_df = prepare_hydrograph_data(
+            station_number, variable, historic_df, realtime_df, forecast_df, analysis_df, forecast_bias_corrected_df, climatology_cache_dir)
+
+        fig = _get_figure_template()
+        draw_annual_hydrograph_statistics(fig, station_number, variable, historic_range_df, realtime_daily_df, forecast_daily_df,
+                                          analysis_daily_df, threshold_registry, forecast_bias_corrected_daily_df)
+        for path in output_paths:
+            fig.savefig(path)
+
+        hash_path.write_text(inputs_hash)
+
+        return {'station': station_number, 'status': 'rendered', 'files': [str(path) for path in output_paths]}
+
+    except Exception as e:
+        logger.error(f'Hydrograph of station {station_number} could not be rendered: {e}')
+        return {'station': station_number, 'status': 'failed', 'files': [], 'error': str(e)}
+
+def render_hydrographs(stations, output_base_dir, output_dir, variable='DISCHARGE', formats=('png',), threshold_csv=None,
+                       bias_correct=True, climatology_cache_dir=None, max_workers=None, force=False, store_dir=None,
+                       forecast_layer='DHPS_1km_RiverDischarge', analysis_layer='DHPS-Analysis_1km_RiverDischarge', ffa_dir=None):
+    """
+    Render the hydrographs of all stations across a pool of processes, without any display.
+
+    Args:
+    stations (list): Station numbers to render.
+    output_base_dir (str or Path): Output directory of the workflow, holding the station csv files.
+    output_dir (str or Path): Directory the hydrographs are written to.
+    variable (str): Variable to plot, e.g. DISCHARGE.
+    formats (tuple): File formats to render, e.g. ('png', 'svg').
+    threshold_csv (str or Path): Optional threshold table (ffa_summary_for_tool.csv).
+    bias_correct (bool): If True, the bias corrected forecast is also plotted.
+    climatology_cache_dir (str or Path): Optional directory where the historic daily percentiles are persisted.
+    max_workers (int): Number of processes, the number of cpus if None.
+    force (bool): If True, stations are rendered even if their inputs are unchanged.
+    store_dir (str or Path): Optional station store holding the station series, instead of the station csv files.
+    forecast_layer, analysis_layer (str): Layers the forecasts and analyses of the stations were extracted from.
+    ffa_dir (str or Path): Optional flood frequency analysis directory, see load_threshold_registry.
+
+    Returns:
+    DataFrame: The render status of each station.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    station_tasks = []
+    for station_number in stations:
+        input_paths = station_input_paths(station_number, output_base_dir, variable, threshold_csv, store_dir, forecast_layer, analysis_layer)
+        if not input_paths['historic'].exists() or not input_paths['realtime'].exists():
+            logger.warning(f'Station {station_number} has no historic or realtime {variable} data, not rendered')
+            continue
+        station_tasks.append((station_number, input_paths))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_render_worker) as executor:
+        futures = [executor.submit(render_station_hydrograph, station_number, variable, input_paths, output_dir, formats,
+                                   bias_correct, climatology_cache_dir, force, ffa_dir)
+                   for station_number, input_paths in station_tasks]
+        results = [future.result() for future in futures]
+
+    render_report = pd.DataFrame(results, columns=['station', 'status', 'files', 'error'])
+    logger.info(f'Hydrographs: {render_report["status"].value_counts().to_dict()}')
+
+    return render_report
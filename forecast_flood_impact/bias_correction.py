@@ -0,0 +1,104 @@
+# Description: This script contains functions to bias correct the NSRPS forecasts with the realtime measurements.
+# Only numpy and pandas are imported on load, xarray is imported by the batch correction of DataArray forecasts.
+import numpy as np
+import pandas as pd
+
+# The forecast times are shifted to UTC-7 (local standard time of the Bow basin)
+LOCAL_TIME_ZONE = 'Etc/GMT+7'
+
+def bias_correct_forecast(measurements, model):
+    
+    # Ensure both dataframes are sorted by index
+    measurements = measurements.sort_index()
+    model = model.sort_index()
+
+    # Find the last overlapping time
+    last_overlap_time = measurements.index.intersection(model.index).max()
+
+    # If there's no overlap, use the last time of the measurements dataframe
+    if pd.isna(last_overlap_time):
+        last_overlap_time = measurements.index[-1]
+
+    # Get the last measurement value
+    last_measurement_value = measurements.loc[last_overlap_time, 'DISCHARGE']
+
+    # Get the corresponding model value at the overlap time
+    if last_overlap_time in model.index:
+        last_model_value = model.loc[last_overlap_time, 'Discharge']
+    else:
+        last_model_value = model.iloc[0]['Discharge']
+
+    # Calculate the correction factor
+    correction_factor = last_measurement_value - last_model_value
+
+    # Apply the correction to the model dataframe
+    model['Discharge'] = model['Discharge'] + correction_factor
+
+    return model
+
+BIAS_CORRECTION_SCHEMES = ['additive', 'multiplicative', 'decaying']
+
+def _last_overlap(measurements_wide, forecast_times):
+    """
+    For each station, the last measurement overlapping the forecast and the index of its forecast time.
+    Without overlap, the last measurement and the first forecast time are used, as in bias_correct_forecast.
+    """
+    measured_at_forecast = measurements_wide.reindex(forecast_times).to_numpy()
+    overlap = ~np.isnan(measured_at_forecast)
+    has_overlap = overlap.any(axis=0)
+
+    overlap_index = len(forecast_times) - 1 - np.argmax(overlap[::-1], axis=0)
+    overlap_index = np.where(has_overlap, overlap_index, 0)
+
+    last_measurement = measurements_wide.ffill().iloc[-1].to_numpy()
+    overlap_value = np.where(has_overlap, measured_at_forecast[overlap_index, np.arange(len(overlap_index))], last_measurement)
+
+    return overlap_index, overlap_value
+
+def bias_correct_forecasts(measurements, forecast, scheme='additive', decay_hours=24.0, station_column='STATION_NUMBER', measurement_column='DISCHARGE'):
+    """
+    Bias correct the forecasts of all stations in one pass, from the last measurement overlapping each forecast.
+
+    Args:
+    measurements (DataFrame): Long format measurements with a datetime index, a station column and a measurement column.
+    forecast (DataArray): Forecast with time and station dimensions, any other dimension (e.g. member) is corrected alike.
+    scheme (str): 'additive' shifts the forecast by the difference at the overlap, 'multiplicative' scales it by
+        the ratio at the overlap, 'decaying' applies the additive shift decaying exponentially after the overlap.
+    decay_hours (float): e-folding time of the 'decaying' correction.
+
+    Returns:
+    DataArray: The corrected forecast, with the overlap time and the correction of each station as coordinates.
+    """
+    import xarray as xr
+
+    if scheme not in BIAS_CORRECTION_SCHEMES:
+        raise ValueError(f'Unknown bias correction scheme {scheme}, use one of {BIAS_CORRECTION_SCHEMES}')
+
+    forecast = forecast.sortby('time')
+    forecast_times = pd.DatetimeIndex(forecast['time'].values)
+    stations = forecast['station'].values
+
+    measurements_wide = measurements.groupby([measurements.index, station_column], observed=True)[measurement_column].mean().unstack()
+    measurements_wide = measurements_wide.reindex(columns=stations).sort_index()
+
+    overlap_index, overlap_value = _last_overlap(measurements_wide, forecast_times)
+    overlap_index = xr.DataArray(overlap_index, dims='station', coords={'station': stations})
+    overlap_value = xr.DataArray(overlap_value, dims='station', coords={'station': stations})
+    forecast_at_overlap = forecast.isel(time=overlap_index)
+
+    if scheme == 'multiplicative':
+        correction = (overlap_value / forecast_at_overlap).where(forecast_at_overlap != 0, 1.0)
+        corrected = forecast * correction
+    else:
+        correction = overlap_value - forecast_at_overlap
+        if scheme == 'decaying':
+            lead_hours = (forecast['time'] - forecast['time'].isel(time=overlap_index)) / np.timedelta64(1, 'h')
+            corrected = forecast + correction * np.exp(-lead_hours.clip(min=0) / decay_hours)
+        else:
+            corrected = forecast + correction
+
+    # Stations without measurements are left uncorrected
+    corrected = corrected.where(overlap_value.notnull(), forecast)
+
+    return corrected.assign_coords(overlap_time=forecast['time'].isel(time=overlap_index).drop_vars('time'),
+                                   correction=correction.drop_vars('time'))
\ No newline at end of file
@@ -0,0 +1,118 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .threshold_registry import as_threshold_registry
+
+logger = logging.getLogger(__name__)
+
+BELOW_LOWEST_THRESHOLD = 'Less than 2 year'
+
+# Colors of the exceedance classes in the plots and maps
+EXCEEDANCE_COLORS = {
+    BELOW_LOWEST_THRESHOLD: 'green',
+    2: 'green',       # 2-year threshold color
+    5: 'yellow',     # 5-year threshold color
+    10: 'orange',    # 10-year threshold color
+    20: 'red',       # 20-year threshold color
+    50: 'purple',    # 50-year threshold color
+    100: 'black'     # 100-year threshold color
+    # Add more colors if there are more thresholds
+}
+EXCEEDANCE_DEFAULT_COLOR = 'gray'
+
+def classify_return_periods(discharge_df, thresholds, station_column='STATION_NUMBER', discharge_column='DISCHARGE'):
+    """
+    Assign the largest exceeded return period to every row of a multi-station discharge frame.
+
+    Args:
+    discharge_df (DataFrame): Long format discharge data with a station column and a discharge column.
+    thresholds (ThresholdRegistry or DataFrame): Threshold registry, or a threshold table as in ffa_summary_for_tool.csv,
+        a T_yrs column and one column per station.
+    station_column (str): Name of the station column in discharge_df.
+    discharge_column (str): Name of the discharge column in discharge_df.
+
+    Returns:
+    DataFrame: Indexed as discharge_df, with the station column and a categorical 'Exceedance' column.
+    Rows for stations without thresholds are left as NaN.
+    """
+    registry = as_threshold_registry(thresholds)
+    categories = [BELOW_LOWEST_THRESHOLD] + registry.t_yrs.tolist()
+
+    # Code 0 is below the lowest threshold, code k the k-th return period, -1 a station without thresholds
+    codes = registry.exceeded_counts(discharge_df[station_column].to_numpy(), discharge_df[discharge_column].to_numpy(dtype=float))
+
+    result = pd.DataFrame({station_column: discharge_df[station_column].to_numpy()}, index=discharge_df.index)
+    result['Exceedance'] = pd.Categorical.from_codes(codes.astype(np.int16), categories=categories)
+
+    return result
+
+def ensemble_exceedance_probabilities(ensemble, thresholds):
+    """
+    Probability of exceeding each return period threshold, as the fraction of ensemble members exceeding it.
+
+    Args:
+    ensemble (DataArray): Ensemble forecast with member, time and station dimensions.
+    thresholds (ThresholdRegistry or DataFrame): Threshold registry, or a threshold table as in ffa_summary_for_tool.csv.
+
+    Returns:
+    Dataset: exceedance_probability at each time (T_yrs, time, station), and peak_exceedance_probability,
+    the probability of exceeding the threshold at any time of the forecast (T_yrs, station).
+    Stations without thresholds are left out.
+    """
+    import xarray as xr
+
+    registry = as_threshold_registry(thresholds)
+    stations = [station for station in ensemble['station'].values if station in registry]
+    ensemble = ensemble.sel(station=stations)
+
+    thresholds = xr.DataArray(registry.matrix[[registry.row[station] for station in stations]].T, dims=('T_yrs', 'station'),
+                              coords={'T_yrs': registry.t_yrs, 'station': stations})
+
+    # Members without a value at a time are not counted
+    valid_members = ensemble.notnull().sum('member')
+    exceeded = ensemble >= thresholds
+    exceedance_probability = exceeded.sum('member') / valid_members.where(valid_members > 0)
+    peak_exceedance_probability = exceeded.any('time').mean('member')
+
+    return xr.Dataset({'exceedance_probability': exceedance_probability.transpose('T_yrs', 'time', 'station'),
+                       'peak_exceedance_probability': peak_exceedance_probability.transpose('T_yrs', 'station')})
+
+def calculate_return_periods(realtime_df, forecast_df, threshold_df, station_number):
+
+    merged_df = pd.concat([realtime_df, forecast_df])
+    station_data = merged_df[merged_df['STATION_NUMBER'] == station_number]
+
+    # threshold_df may also be a ThresholdRegistry loaded once for all stations,
+    # from a threshold table only the thresholds of the station are compiled
+    if isinstance(threshold_df, pd.DataFrame):
+        threshold_df = threshold_df[threshold_df.columns.intersection(['T_yrs', station_number])]
+    result = classify_return_periods(station_data, threshold_df)
+
+    return result[['Exceedance']]
+
+def plot_exceedance(result,station):
+    # matplotlib is only imported for plotting, the classification does not need it
+    import matplotlib.pyplot as plt
+
+    # Predefined set of colors
+    color_map = EXCEEDANCE_COLORS
+
+    # Handle any unspecified statuses by a default color
+    default_color = EXCEEDANCE_DEFAULT_COLOR
+
+    # Plotting
+    plt.figure(figsize=(12, 6))
+    for status in result['Exceedance'].unique():
+        color = color_map.get(status, default_color)
+        to_plot = result[result['Exceedance'] == status]
+        plt.scatter(to_plot.index, np.full(to_plot.shape[0], status), color=color, label=status)
+
+    plt.xlabel('DateTime')
+    plt.ylabel('Return Period')
+    plt.title(f'Return Period Plot for Station {station}')
+    plt.legend()
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,152 @@
+# Description: This script contains functions to calculate the daily means and the daily climatology (percentiles of
+# the historic data) of the stations, with numpy and pandas only.
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from .bias_correction import LOCAL_TIME_ZONE
+
+CLIMATOLOGY_COLUMNS = ['Max', 'Min', '90th', '10th', '75th', '25th']
+
+def _local_time_index(df, date_col):
+    """
+    Datetimes of the date_col column (or of the index, if date_col is not a column) in the local time of the forecasts
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(df[date_col] if date_col in df.columns else df.index), name=date_col)
+
+    # Observations in UTC are converted to the local time of the forecasts, so both share one time axis
+    if times.tz is not None:
+        times = times.tz_convert(LOCAL_TIME_ZONE).tz_localize(None)
+
+    return times
+
+def convert_to_daily_mean(df, variable, date_col='DATETIME'):
+    """
+    Convert the df DataFrame to daily mean values for the "LEVEL" and "DISCHARGE" columns.
+
+    Args:
+    df (DataFrame): Pandas DataFrame containing the realtime data with columns: DATETIME, STATION_NUMBER, STATION_NAME, LEVEL, DISCHARGE.
+        The datetimes may also be the index. df is left unchanged.
+
+    Returns:
+    DataFrame: Pandas DataFrame with daily mean values for the "LEVEL" and "DISCHARGE" columns.
+    """
+    values = pd.Series(df[variable].to_numpy(), index=_local_time_index(df, date_col), name=variable)
+
+    # Resample to daily frequency and calculate the mean
+    daily_mean_df = values.resample('D').mean()
+
+    return daily_mean_df
+
+def daily_mean_for_stations(df, variable, station_column='STATION_NUMBER', date_col='DATETIME'):
+    """
+    Daily mean of every station of a multi-station frame in a single grouping on the integer day number,
+    without a resample per station. df is left unchanged.
+
+    Returns:
+    Series: The daily means indexed by station and date. Days without records are left out.
+    """
+    times = _local_time_index(df, date_col)
+    days = times.asi8 // pd.Timedelta(days=1).value
+
+    daily_mean = df[variable].groupby([df[station_column], days], observed=True, sort=True).mean()
+    daily_mean.index = pd.MultiIndex.from_arrays(
+        [daily_mean.index.get_level_values(0),
+         pd.to_datetime(daily_mean.index.get_level_values(1) * pd.Timedelta(days=1).value).rename(date_col)],
+        names=[station_column, date_col])
+
+    return daily_mean
+
+def _daily_envelope(df, variable, group_columns=[]):
+    """
+    Max, min and 90-10, 75-25 percentiles of the values on each day of the year, in one grouped pass.
+
+    Returns:
+    DataFrame: Indexed by the group columns, MONTH and DAY, with the CLIMATOLOGY_COLUMNS.
+    """
+    dates = pd.to_datetime(df['DATE'])
+    keys = [df[column] for column in group_columns] + [dates.dt.month.rename('MONTH'), dates.dt.day.rename('DAY')]
+    grouped = df[variable].groupby(keys, sort=True)
+
+    envelope = grouped.agg(['max', 'min']).rename(columns={'max': 'Max', 'min': 'Min'})
+    percentiles = grouped.quantile([0.9, 0.1, 0.75, 0.25]).unstack()
+    envelope[['90th', '10th', '75th', '25th']] = percentiles.to_numpy()
+
+    # Days without any values are left out, as are all-NaN stations
+    return envelope.dropna(how='all')
+
+def _assign_water_year(envelope):
+    """
+    Replace the MONTH and DAY levels of a daily envelope by dates in the current water year (October to September)
+    """
+    today = pd.to_datetime('today')
+    # If current month is October, November, or December, the water year ends next year
+    water_year_end = today.year + 1 if today.month in [10, 11, 12] else today.year
+
+    envelope = envelope.reset_index()
+    year = np.where(envelope['MONTH'] >= 10, water_year_end - 1, water_year_end)
+    dates = pd.to_datetime(pd.DataFrame({'year': year, 'month': envelope['MONTH'], 'day': envelope['DAY']}), errors='coerce')
+
+    # February 29 has no date when the water year does not end in a leap year
+    envelope = envelope.drop(columns=['MONTH', 'DAY'])[dates.notna().to_numpy()]
+    envelope.index = pd.DatetimeIndex(dates.dropna())
+
+    return envelope
+
+def calculate_daily_percentiles_of_historic_data(df, variable):
+    """
+    Calculate the daily percentiles for the discharge data.
+    
+    Args:
+    df (DataFrame): Pandas DataFrame containing the discharge data with a 'DATE' column.
+    
+    Returns:
+
+    DataFrame: The Max, Min, 90th, 10th, 75th and 25th percentile of each day, indexed by date in the current water year.
+    """
+    historic_range_df = _daily_envelope(df, variable)
+
+    return _assign_water_year(historic_range_df)[CLIMATOLOGY_COLUMNS].sort_index()
+
+def calculate_daily_percentiles_for_stations(df, variable, station_column='STATION_NUMBER'):
+    """
+    Calculate the daily percentiles of the historic data of several stations at once.
+
+    Args:
+    df (DataFrame): Long format historic data with a 'DATE' column and a station column.
+
+    Returns:
+    DataFrame: The Max, Min, 90th, 10th, 75th and 25th percentile of each day, indexed by station and date in the current water year.
+    """
+    historic_range_df = _assign_water_year(_daily_envelope(df, variable, [station_column]))
+
+    return historic_range_df.set_index(station_column, append=True).swaplevel().sort_index()[CLIMATOLOGY_COLUMNS]
+
+def _historic_data_hash(df, variable):
+    """
+    Hash of the dates and values of the historic data, identifying the data a climatology was computed from
+    """
+    hashed = pd.util.hash_pandas_object(df[['DATE', variable]].astype(str), index=False)
+
+    return f'{int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF:016x}'
+
+def load_or_calculate_daily_percentiles(df, variable, station_number, cache_dir):
+    """
+    Daily percentiles of the historic data of a station, persisted in cache_dir.
+    The percentiles are only recomputed when the historic data has changed since they were stored.
+    """
+    climatology_dir = Path(cache_dir, 'climatology')
+    data_hash = _historic_data_hash(df, variable)
+    cache_path = Path(climatology_dir, f'{station_number}_{variable}_{data_hash}.csv')
+
+    if cache_path.exists():
+        historic_range_df = pd.read_csv(cache_path, index_col=['MONTH', 'DAY'])
+    else:
+        historic_range_df = _daily_envelope(df, variable)
+        climatology_dir.mkdir(parents=True, exist_ok=True)
+        # Remove the climatology computed from previous versions of the data
+        for stale_path in climatology_dir.glob(f'{station_number}_{variable}_*.csv'):
+            stale_path.unlink()
+        historic_range_df.to_csv(cache_path)
+
+    return _assign_water_year(historic_range_df)[CLIMATOLOGY_COLUMNS].sort_index()
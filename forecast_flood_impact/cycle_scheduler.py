@@ -0,0 +1,213 @@
+# Description: Long-running scheduler polling the GeoMet WMS capabilities for new NSRPS forecast and analysis cycles,
+# running the workflow as soon as a new cycle is published.
+#
+# Usage: python -m forecast_flood_impact.cycle_scheduler --config settings/general_settings.yaml [--once]
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+from .geomet_cache import cache_key, write_cached_capabilities
+from .run_pipeline import load_settings, load_login, run_pipeline, STAGES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stages run for each new cycle, all the stages of the pipeline
+CYCLE_STAGES = list(STAGES)
+
+def load_state(state_path):
+    """
+    Last seen reference time and HTTP validators of each layer
+    """
+    if not Path(state_path).exists():
+        return {}
+
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+def save_state(state, state_path):
+    Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+def fetch_capabilities_if_changed(session, layer_name, geomet_url, layer_state):
+    """
+    Request the WMS capabilities of a layer, conditional on the validators of the last response.
+
+    Returns:
+    bytes: The capabilities document, or None if the server answered that it is unchanged (304).
+    """
+    headers = {}
+    if layer_state.get('etag'):
+        headers['If-None-Match'] = layer_state['etag']
+    if layer_state.get('last_modified'):
+        headers['If-Modified-Since'] = layer_state['last_modified']
+
+    response = session.get(geomet_url, params={'SERVICE': 'WMS', 'VERSION': '1.3.0', 'REQUEST': 'GetCapabilities',
+                                               'LAYERS': layer_name},
+                           headers=headers, timeout=60)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    layer_state['etag'] = response.headers.get('ETag')
+    layer_state['last_modified'] = response.headers.get('Last-Modified')
+
+    return response.content
+
+def newest_reference_time(xml, layer_name, geomet_url):
+    """
+    Newest reference time of a layer in a WMS capabilities document
+    """
+    from owslib.wms import WebMapService
+
+    wms = WebMapService(f'{geomet_url}?&SERVICE=WMS&LAYERS={layer_name}', version='1.3.0', xml=xml)
+    oldest, newest, interval = wms[layer_name].dimensions['reference_time']['values'][0].split('/')
+
+    return newest
+
+def poll_new_cycles(session, layer_names, geomet_url, state, cache_dir=None):
+    """
+    Poll the capabilities of each layer once.
+
+    The capabilities of changed layers are written to the capabilities cache, so the workflow triggered
+    for the new cycle reuses them instead of requesting them again.
+
+    Returns:
+    dict: The new reference time of each layer with a new cycle.
+    """
+    new_cycles = {}
+    for layer_name in layer_names:
+        layer_state = state.setdefault(layer_name, {})
+        try:
+            xml = fetch_capabilities_if_changed(session, layer_name, geomet_url, layer_state)
+        except requests.RequestException as e:
+            logger.warning(f'Capabilities of {layer_name} could not be polled: {e}')
+            continue
+        if xml is None:
+            continue
+
+        reference_time = newest_reference_time(xml, layer_name, geomet_url)
+        # A failed cycle is run again by its retries only (see due_retries)
+        if reference_time not in (layer_state.get('reference_time'), layer_state.get('failed_reference_time')):
+            logger.info(f'New cycle of {layer_name}: {reference_time}')
+            new_cycles[layer_name] = reference_time
+            if cache_dir is not None:
+                key = cache_key(url=f'{geomet_url}?&SERVICE=WMS&LAYERS={layer_name}', version='1.3.0')
+                write_cached_capabilities(cache_dir, key, xml)
+
+    return new_cycles
+
+def due_retries(state, now, max_attempts):
+    """
+    Failed cycle of each layer whose next attempt is due, as long as it failed less than max_attempts times
+    """
+    return {layer_name: layer_state['failed_reference_time'] for layer_name, layer_state in state.items()
+            if layer_state.get('failed_reference_time') and layer_state.get('attempts', 0) < max_attempts
+            and datetime.fromisoformat(layer_state['retry_at']) <= now}
+
+def record_failed_cycles(state, cycles, now, max_attempts, retry_backoff):
+    """
+    Count the failed attempt of each cycle and schedule its retry, retry_backoff seconds after the first
+    failure and doubled after each following one
+    """
+    for layer_name, reference_time in cycles.items():
+        layer_state = state[layer_name]
+        attempts = layer_state.get('attempts', 0) + 1 if layer_state.get('failed_reference_time') == reference_time else 1
+        retry_at = now + timedelta(seconds=retry_backoff * 2 ** (attempts - 1))
+        layer_state.update(failed_reference_time=reference_time, attempts=attempts, retry_at=retry_at.isoformat())
+        if attempts >= max_attempts:
+            logger.error(f'Cycle {reference_time} of {layer_name} failed {attempts} times, waiting for the next cycle')
+        else:
+            logger.warning(f'Cycle {reference_time} of {layer_name} failed on attempt {attempts}, retrying at {retry_at:%H:%M:%S}')
+
+def run_scheduler(config_file, poll_interval=60, stages=CYCLE_STAGES, variable='DISCHARGE', once=False, max_attempts=3,
+                  retry_backoff=300):
+    """
+    Poll for new forecast and analysis cycles every poll_interval seconds and run the workflow for each new cycle.
+
+    The last seen reference times and HTTP validators are kept in {cache_dir}/scheduler_state.json. The reference
+    times are only updated once the workflow succeeded: a failed cycle is recorded with its number of attempts
+    and run again after a backoff, until it failed max_attempts times or a newer cycle is published.
+
+    Args:
+    config_file (str or Path): Path to the settings yaml file.
+    poll_interval (float): Seconds between two polls.
+    stages (list): Stages of the workflow run for a new cycle.
+    variable (str): Hydrometric variable to process.
+    once (bool): If True, poll a single time and return.
+    max_attempts (int): Number of runs of a failed cycle before waiting for the next cycle.
+    retry_backoff (float): Seconds before the first retry of a failed cycle, doubled after each following failure.
+    """
+    config = load_settings(config_file)
+    settings = config['geomet_settings']
+    cache_dir = config['paths']['cache_dir']
+    state_path = Path(cache_dir, 'scheduler_state.json')
+    layer_names = [settings['forecast_layer'], settings['analysis_layer']]
+
+    login = load_login(config)
+    session = requests.Session()
+    if login['Username'] is not None:
+        session.auth = (login['Username'], login['Password'])
+
+    state = load_state(state_path)
+
+    while True:
+        poll_start = time.monotonic()
+        new_cycles = poll_new_cycles(session, layer_names, settings['url'], state, cache_dir)
+        # A newer cycle of a layer replaces its failed cycle
+        cycles = {**due_retries(state, datetime.now(timezone.utc), max_attempts), **new_cycles}
+
+        if cycles:
+            detected = datetime.now(timezone.utc)
+            report = run_pipeline(config_file, stages, variable)
+            logger.info(f'Workflow {report["status"]} for {cycles}, '
+                        f'{(datetime.now(timezone.utc) - detected).total_seconds():.1f} s after the cycle was detected')
+            if report['status'] == 'ok':
+                # The workflow runs on the newest cycle of every layer, which includes the failed cycles of the other layers
+                failed_cycles = {layer_name: layer_state['failed_reference_time'] for layer_name, layer_state in state.items()
+                                 if layer_state.get('failed_reference_time')}
+                for layer_name, reference_time in {**failed_cycles, **cycles}.items():
+                    state[layer_name]['reference_time'] = reference_time
+                    for key in ['failed_reference_time', 'attempts', 'retry_at']:
+                        state[layer_name].pop(key, None)
+            else:
+                record_failed_cycles(state, cycles, datetime.now(timezone.utc), max_attempts, retry_backoff)
+
+        save_state(state, state_path)
+
+        if once:
+            return cycles
+        time.sleep(max(0, poll_interval - (time.monotonic() - poll_start)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Forecast Flood Impact workflow for each new NSRPS cycle.')
+    parser.add_argument('--config', default=str(Path(__file__).resolve().parents[1] / 'settings' / 'general_settings.yaml'),
+                        help='Path to the settings yaml file.')
+    parser.add_argument('--stages', default=','.join(CYCLE_STAGES),
+                        help=f'Comma separated stages to run for a new cycle. Default: {",".join(CYCLE_STAGES)}')
+    parser.add_argument('--variable', default='DISCHARGE', help='Hydrometric variable to process.')
+    parser.add_argument('--once', action='store_true', help='Poll a single time and exit.')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown_stages = [stage for stage in stages if stage not in STAGES]
+    if unknown_stages:
+        parser.error(f'Unknown stages: {unknown_stages}')
+
+    config = load_settings(args.config)
+    scheduler_settings = config.get('scheduler_settings', {})
+
+    run_scheduler(args.config, scheduler_settings.get('poll_interval', 60), stages, args.variable, args.once,
+                  scheduler_settings.get('max_attempts', 3), scheduler_settings.get('retry_backoff', 300))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# Description: This script contains functions to cache GeoMet WCS coverages and WMS capabilities on disk.
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def cache_key(**params):
+    """
+    Content address for a request, a hash of its parameters (layer, reference time, time, bbox, ...)
+    """
+    key_string = json.dumps(params, sort_keys=True, default=str)
+
+    return hashlib.sha256(key_string.encode()).hexdigest()
+
+def _write_atomic(path, payload):
+    """
+    Write to a temporary file and rename, so concurrent readers never see a partial payload
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'{path.suffix}.{os.getpid()}.tmp')
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+def read_cached_coverage(cache_dir, key):
+    """
+    Read a cached coverage payload, or None if it is not in the cache.
+    Reading refreshes the modification time, which orders the least recently used eviction.
+    """
+    path = Path(cache_dir, 'coverages', f'{key}.nc')
+    try:
+        payload = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+
+    return payload
+
+def evict_coverages(cache_dir, max_cache_bytes):
+    """
+    Remove the least recently used coverages until the cache is below max_cache_bytes.
+    Every cached coverage is listed, so it is called once per fetch rather than on each write.
+    """
+    entries = []
+    for path in Path(cache_dir, 'coverages').glob('*.nc'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        try:
+            path.unlink()
+            total_bytes -= size
+            logger.info(f'Evicted {path.name} from the coverage cache')
+        except FileNotFoundError:
+            continue
+
+def write_cached_coverage(cache_dir, key, payload):
+    """
+    Store a coverage payload in the cache. The cache is not evicted on each write, the fetches call
+    evict_coverages once all their coverages are written.
+    """
+    _write_atomic(Path(cache_dir, 'coverages', f'{key}.nc'), payload)
+
+def read_cached_capabilities(cache_dir, key, ttl):
+    """
+    Read a cached capabilities document, or None if it is missing or older than ttl seconds
+    """
+    path = Path(cache_dir, 'capabilities', f'{key}.xml')
+    try:
+        age = time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if age > ttl:
+        return None
+
+    return path.read_bytes()
+
+def write_cached_capabilities(cache_dir, key, xml):
+    """
+    Store a capabilities document in the cache
+    """
+    _write_atomic(Path(cache_dir, 'capabilities', f'{key}.xml'), xml)
@@ -0,0 +1,188 @@
+import hashlib
+import logging
+from pathlib import Path
+
+import geopandas as gpd
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+import cartopy.crs as ccrs
+from cartopy.io.img_tiles import OSM
+import numpy as np
+import pandas as pd
+
+from .calculate_return_periods import BELOW_LOWEST_THRESHOLD, EXCEEDANCE_COLORS, EXCEEDANCE_DEFAULT_COLOR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Web Mercator, the projection of the OSM tiles, so the tiles are drawn without being warped
+MAP_EPSG = 3857
+# Size of a pixel of a 256 pixel tile at zoom level 0, in Web Mercator meters
+ZOOM_0_PIXEL_SIZE = 156543.03
+
+class CachedOSM(OSM):
+    """
+    OSM tiles cached on disk as by cartopy, except the blank tiles returned when a tile can't be fetched (e.g. offline),
+    which are not kept so the tile is fetched again on the next render
+    """
+    blank_tile_color = (250, 250, 250)
+
+    def get_image(self, tile):
+        cached_file = self._cache_dir / ('_'.join(str(i) for i in tile) + '.npy') if self.cache_path is not None else None
+        was_cached = cached_file in self.cache
+
+        img, extent, origin = super().get_image(tile)
+
+        if cached_file is not None and not was_cached and (np.asarray(img) == self.blank_tile_color).all():
+            self.cache.discard(cached_file)
+            cached_file.unlink(missing_ok=True)
+
+        return img, extent, origin
+
+def load_map_geometries(shapefile, cache_dir, zoom=10):
+    """
+    Geometries of a shapefile reprojected to Web Mercator and simplified to the pixel size of the zoom level.
+
+    The result is cached as GeoParquet in {cache_dir}/geometries, keyed by the zoom level and the size and
+    modification time of the shapefile, so later renders skip the shapefile parsing and reprojection.
+    """
+    shapefile = Path(shapefile)
+    stat = shapefile.stat()
+    source_key = hashlib.sha1(f'{shapefile.resolve()}{stat.st_size}{stat.st_mtime_ns}'.encode()).hexdigest()[:8]
+    cache_path = Path(cache_dir, 'geometries', f'{shapefile.stem}_z{zoom}_{source_key}.parquet')
+
+    if cache_path.exists():
+        return gpd.read_parquet(cache_path)
+
+    geometries = gpd.read_file(shapefile).to_crs(epsg=MAP_EPSG)
+    if geometries.empty:
+        raise ValueError(f'{shapefile} is empty.')
+    geometries['geometry'] = geometries.geometry.simplify(ZOOM_0_PIXEL_SIZE / 2 ** zoom, preserve_topology=True)
+    geometries = geometries[['geometry']]
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    geometries.to_parquet(cache_path)
+    logger.info(f'Map geometries output to {cache_path}')
+
+    return geometries
+
+def peak_station_classes(return_period_dir, stations):
+    """
+    Highest return period class of each station over its observed and forecasted return periods
+    (the {station}_return_periods.csv files of the classification), NaN for stations without classification.
+    """
+    station_classes = {}
+    for station in stations:
+        csv_path = Path(return_period_dir, f'{station}_return_periods.csv')
+        if not csv_path.exists():
+            continue
+        t_yrs = pd.to_numeric(pd.read_csv(csv_path)['Exceedance'], errors='coerce')
+        station_classes[station] = BELOW_LOWEST_THRESHOLD if t_yrs.isna().all() else int(t_yrs.max())
+
+    return pd.Series(station_classes, dtype=object).reindex(stations)
+
+def render_station_map(watershed_shapefile, flowlines_shapefile, stations_csv, output_path, cache_dir, station_classes=None,
+                       zoom=10, label_stations=True):
+    """
+    Render the map of the watershed, flowlines and stations to file, without any display.
+
+    The simplified geometries and the OSM tiles are cached in cache_dir, so repeated renders read
+    everything from disk and work offline once the tiles of the extent were fetched.
+
+    Args:
+    watershed_shapefile, flowlines_shapefile (str or Path): Shapefiles of the watershed and flowlines.
+    stations_csv (str or Path): Stations with ID, Name / Nom, Latitude and Longitude columns.
+    output_path (str or Path): Path of the map file, its format is taken from the suffix.
+    cache_dir (str or Path): Cache directory of the geometries and tiles.
+    station_classes (Series): Optional return period class of each station, used to color the stations.
+    zoom (int): Zoom level of the OSM tiles.
+    label_stations (bool): If True, the stations are labelled with their name.
+
+    Returns:
+    Path: The path of the map.
+    """
+    watershed = load_map_geometries(watershed_shapefile, cache_dir, zoom)
+    flowlines = load_map_geometries(flowlines_shapefile, cache_dir, zoom)
+    stations = pd.read_csv(stations_csv)
+
+    osm = CachedOSM(cache=Path(cache_dir, 'tiles'))
+
+    fig = Figure(figsize=(15, 15))
+    ax = fig.add_subplot(projection=osm.crs)
+
+    minx, miny, maxx, maxy = watershed.total_bounds
+    ax.set_extent([minx, maxx, miny, maxy], crs=osm.crs)
+    ax.add_image(osm, zoom)
+
+    watershed.plot(ax=ax, edgecolor='green', facecolor='none', linewidth=1)
+    flowlines.plot(ax=ax, color='blue', linewidth=0.5)
+
+    if station_classes is not None:
+        classes = stations['ID'].map(station_classes)
+        colors = [EXCEEDANCE_COLORS.get(status, EXCEEDANCE_DEFAULT_COLOR) for status in classes]
+        handles = [Line2D([], [], color=EXCEEDANCE_COLORS.get(status, EXCEEDANCE_DEFAULT_COLOR), marker='o', linestyle='',
+                          label=status if status == BELOW_LOWEST_THRESHOLD else f'{status} year')
+                   for status in sorted(classes.dropna().unique(), key=lambda status: 0 if status == BELOW_LOWEST_THRESHOLD else status)]
+        ax.scatter(stations['Longitude'], stations['Latitude'], c=colors, marker='o', s=80, edgecolors='black',
+                   transform=ccrs.PlateCarree(), zorder=3)
+        if handles:
+            ax.legend(handles=handles, title='Return period', loc='upper right')
+    else:
+        ax.scatter(stations['Longitude'], stations['Latitude'], color='black', marker='x', s=50,
+                   transform=ccrs.PlateCarree(), zorder=3)
+
+    if label_stations:
+        for longitude, latitude, name in zip(stations['Longitude'], stations['Latitude'], stations['Name / Nom']):
+            ax.text(longitude, latitude, name, fontsize=8, ha='right', va='bottom', transform=ccrs.PlateCarree(),
+                    bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.5))
+
+    ax.set_title("Bow Watershed, Flowlines and Stations")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output_path)
+
+    return output_path
+
+
+def plot_watershed_flowlines_stations(watershed_shapefile, flowlines_shapefile, stations_csv):
+    # Read the shapefiles with GeoPandas
+    watershed = gpd.read_file(watershed_shapefile)
+    flowlines = gpd.read_file(flowlines_shapefile)
+    stations =  pd.read_csv(stations_csv)
+
+    # Ensure the shapefiles are not empty
+    if watershed.empty or flowlines.empty:
+        raise ValueError("One or both of the shapefiles are empty.")
+
+    # Set up the figure and axis with Cartopy, using the OSM projection
+    fig, ax = plt.subplots(figsize=(15, 15), subplot_kw={'projection': ccrs.PlateCarree()})
+
+    # Add OSM basemap
+    osm = OSM()
+    ax.add_image(osm,10)
+
+    # Reproject shapefiles to the same CRS as the basemap (Plate Carree - EPSG:4326)
+    watershed = watershed.to_crs(epsg=4326)
+    flowlines = flowlines.to_crs(epsg=4326)
+
+    # Plot the shapefiles
+    watershed.plot(ax=ax, edgecolor='green', facecolor='none',linewidth=1)
+    flowlines.plot(ax=ax, color='blue',linewidth=0.5)  
+    
+    #ax.scatter(stations['Longitude'], stations['Latitude'], color='black', marker='x', s=50, label='Hydrometric Stations')
+
+    for index, row in stations.iterrows():
+            ax.scatter(row['Longitude'], row['Latitude'], color='black', marker='x', s=50)
+            ax.text(row['Longitude'], row['Latitude'], row['Name / Nom'], fontsize=8, ha='right', va='bottom',
+                bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.5))
+
+    # Add a title
+    ax.set_title("Bow Watershed, Flowlines and Stations")
+
+    plt.show()
+
+
+
+
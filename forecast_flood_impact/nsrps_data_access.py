@@ -0,0 +1,681 @@
+# Description: This script contains functions to retrieve scalar data from the Environment and Climate Change Canada (ECCC) API.
+# data
+import warnings
+import os
+import re
+import time
+import hashlib
+import configparser
+from pathlib import Path
+from datetime import datetime, timedelta
+import xarray as xr 
+import pandas as pd
+import numpy as np
+
+from .geomet_cache import (cache_key, read_cached_coverage, write_cached_coverage, evict_coverages, read_cached_capabilities,
+                           write_cached_capabilities)
+# Bias correction and the local time zone, kept importable from here
+from .bias_correction import bias_correct_forecast, bias_correct_forecasts, BIAS_CORRECTION_SCHEMES, LOCAL_TIME_ZONE
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GEOMET_URL = 'https://geo.weather.gc.ca/geomet'
+DEFAULT_SUBSETS = [('lat', 50, 52.0), ('lon', -117.0, -113.0)]
+# Leading bytes of the NetCDF classic (CDF1, CDF2, CDF5) and NetCDF-4/HDF5 coverage payloads
+NETCDF_SIGNATURES = (b'CDF\x01', b'CDF\x02', b'CDF\x05', b'\x89HDF\r\n\x1a\n')
+
+def connect_to_wms_service(layer_name, login, geomet_url=GEOMET_URL, cache_dir=None, capabilities_ttl=300):
+    """
+    Connect to the WMS service for the layer, reusing a cached capabilities document younger than capabilities_ttl seconds
+    """
+    # owslib is only imported by the functions connecting to the services
+    from owslib.wms import WebMapService
+    from owslib.wcs import Authentication
+
+    url = f'{geomet_url}?&SERVICE=WMS&LAYERS={layer_name}'
+    auth = Authentication(username=login['Username'], password=login['Password'])
+
+    if cache_dir is not None:
+        key = cache_key(url=url, version='1.3.0')
+        xml = read_cached_capabilities(cache_dir, key, capabilities_ttl)
+        if xml is not None:
+            logger.info(f'Using cached WMS capabilities for {layer_name}')
+            return WebMapService(url, version='1.3.0', xml=xml, auth=auth, timeout=300)
+
+    wms = WebMapService(url, version='1.3.0', auth=auth, timeout=300)
+
+    if cache_dir is not None:
+        write_cached_capabilities(cache_dir, key, wms.getServiceXML())
+
+    return wms
+
+def query_wms_service_for_forecast_times(layer_name, login,iso_format="%Y-%m-%dT%H:%M:%SZ", geomet_url=GEOMET_URL, cache_dir=None, capabilities_ttl=300):
+    """
+    Query the WMS service for the forecast times available for the layer
+    """
+    # first querying the WMS for time metadata
+    wms = connect_to_wms_service(layer_name, login, geomet_url, cache_dir, capabilities_ttl)
+    first_datetime, last_datetime, datetime_interval = wms[layer_name].dimensions['time']['values'][0].split('/')
+    oldest_fcst, newest_fcast, interval = wms[layer_name].dimensions['reference_time']['values'][0].split('/')
+
+    # convert dates to datetime objects
+    
+    first = datetime.strptime(first_datetime, iso_format)
+    last = datetime.strptime(last_datetime, iso_format)
+
+    # remove anything that isn't a number from the datetime interval (time between forecasts)
+    intvl = int(re.sub(r'\D', '', datetime_interval))
+
+    # create a list of forecast datetimes (we will add these to the requested data)
+    fcasthrs = [first]
+    while first < last:
+        first = first + timedelta(hours=intvl)
+        fcasthrs.append(first)
+
+    return newest_fcast, fcasthrs
+
+def query_wms_service_for_analysis_times(layer_name, login,iso_format="%Y-%m-%dT%H:%M:%SZ", geomet_url=GEOMET_URL, cache_dir=None, capabilities_ttl=300,
+                                         all_times=False):
+    """
+    Query the WMS service for the analysis times available for the layer
+
+    Returns:
+    str: The first analysis time, or with all_times the list of every available analysis reference time.
+    """
+    # first querying the WMS for time metadata
+    wms = connect_to_wms_service(layer_name, login, geomet_url, cache_dir, capabilities_ttl)
+
+    first_datetime, last_datetime, datetime_interval = wms[layer_name].dimensions['time']['values'][0].split('/')
+    oldest_analysis, newest_analysis, interval = wms[layer_name].dimensions['reference_time']['values'][0].split('/')
+
+    # convert dates to datetime objects
+    
+    first = datetime.strptime(oldest_analysis, iso_format)
+    last = datetime.strptime(newest_analysis, iso_format)
+
+    # remove anything that isn't a number from the datetime interval (time between forecasts)
+    intvl = int(re.sub(r'\D', '', interval))
+
+    # create a list of forecast datetimes (we will add these to the requested data)
+    analysishrs = [first]
+    while first < last:
+        first = first + timedelta(hours=intvl)
+        analysishrs.append(first)
+
+    if all_times:
+        return [datetime.strftime(hr, iso_format) for hr in analysishrs]
+
+    return first_datetime
+
+def connect_to_wcs_service(layer_name, login, geomet_url=GEOMET_URL):
+    """
+    Connect to the WCS service for the layer
+    """
+    from owslib.wcs import WebCoverageService, Authentication
+
+    wcs = WebCoverageService(f'{geomet_url}?&SERVICE=WCS&COVERAGEID={layer_name}',
+                             auth=Authentication(username=login['Username'], password=login['Password']),
+                             version='2.0.1',
+                             timeout=300)
+
+    return wcs
+
+def station_extent(stations_df, buffer=0.05):
+    """
+    Extent (lat_min, lat_max, lon_min, lon_max) holding all stations, with a buffer in degrees
+    """
+    return (stations_df['MODEL_LATITUDE'].min() - buffer, stations_df['MODEL_LATITUDE'].max() + buffer,
+            stations_df['MODEL_LONGITUDE'].min() - buffer, stations_df['MODEL_LONGITUDE'].max() + buffer)
+
+def basin_extent(basins_shapefile, buffer=0.05):
+    """
+    Extent (lat_min, lat_max, lon_min, lon_max) of the basins of a shapefile, with a buffer in degrees
+    """
+    import geopandas as gpd
+
+    lon_min, lat_min, lon_max, lat_max = gpd.read_file(basins_shapefile).to_crs(epsg=4326).total_bounds
+
+    return (lat_min - buffer, lat_max + buffer, lon_min - buffer, lon_max + buffer)
+
+def extent_subsets(extent):
+    """
+    WCS subsets of an extent (lat_min, lat_max, lon_min, lon_max)
+    """
+    lat_min, lat_max, lon_min, lon_max = [round(float(bound), 6) for bound in extent]
+
+    return [('lat', lat_min, lat_max), ('lon', lon_min, lon_max)]
+
+def tile_subsets(extent, tile_size=1.0, stations_df=None, buffer=0.05):
+    """
+    Split an extent into tiles of at most tile_size degrees, each requested separately.
+
+    Args:
+    extent (tuple): lat_min, lat_max, lon_min, lon_max of the domain.
+    tile_size (float): Maximum size of a tile in degrees, the extent is a single tile if None.
+    stations_df (DataFrame): Optional station locations, tiles with no station within buffer degrees are skipped.
+    buffer (float): Distance in degrees within which a station is considered on a tile, so the grid
+        cells nearest to stations on a tile edge are always requested.
+
+    Returns:
+    list: The WCS subsets of each tile.
+    """
+    lat_min, lat_max, lon_min, lon_max = extent
+    if tile_size is None:
+        return [extent_subsets(extent)]
+
+    lat_edges = np.linspace(lat_min, lat_max, max(1, int(np.ceil((lat_max - lat_min) / tile_size))) + 1)
+    lon_edges = np.linspace(lon_min, lon_max, max(1, int(np.ceil((lon_max - lon_min) / tile_size))) + 1)
+
+    tiles = []
+    for tile_lat_min, tile_lat_max in zip(lat_edges[:-1], lat_edges[1:]):
+        for tile_lon_min, tile_lon_max in zip(lon_edges[:-1], lon_edges[1:]):
+            if stations_df is not None:
+                on_tile = (stations_df['MODEL_LATITUDE'].between(tile_lat_min - buffer, tile_lat_max + buffer) &
+                           stations_df['MODEL_LONGITUDE'].between(tile_lon_min - buffer, tile_lon_max + buffer))
+                if not on_tile.any():
+                    continue
+            tiles.append(extent_subsets((tile_lat_min, tile_lat_max, tile_lon_min, tile_lon_max)))
+
+    logger.info(f'Domain split in {len(tiles)} of {(len(lat_edges) - 1) * (len(lon_edges) - 1)} tiles')
+
+    return tiles
+
+def station_windows(stations_df, window_size=0.25, margin=0.02):
+    """
+    Group the stations into small request windows, so only the grid cells around the stations are downloaded.
+
+    Stations are grouped by blocks of window_size degrees and each group is requested as the bounding box
+    of its stations, extended by a margin in degrees (a few grid cells) so it holds the nearest cell of every station.
+
+    Returns:
+    list: The WCS subsets of each window, to be used as tiles with the stations_df of the query functions.
+    """
+    lat_block = np.floor(stations_df['MODEL_LATITUDE'] / window_size)
+    lon_block = np.floor(stations_df['MODEL_LONGITUDE'] / window_size)
+
+    windows = []
+    for block, block_stations in stations_df.groupby([lat_block, lon_block]):
+        windows.append(extent_subsets(station_extent(block_stations, margin)))
+
+    logger.info(f'{len(stations_df)} stations grouped in {len(windows)} windows')
+
+    return windows
+
+def _stations_on_tile(stations_df, subsets):
+    """
+    Stations within the lat/lon subsets of a tile
+    """
+    bounds = {name: (lower, upper) for name, lower, upper in subsets}
+
+    return stations_df[stations_df['MODEL_LATITUDE'].between(*bounds['lat']) &
+                       stations_df['MODEL_LONGITUDE'].between(*bounds['lon'])]
+
+def concat_station_tiles(tile_datasets):
+    """
+    Concatenate the stations extracted from each tile, stations on overlapping tiles are kept once
+    """
+    ds = xr.concat(tile_datasets, dim='station')
+
+    return ds.isel(station=~ds.get_index('station').duplicated())
+
+def stitch_tiles(tile_datasets):
+    """
+    Stitch the coverages of the tiles of a domain back into a single grid.
+    Cells on the shared edges of tiles hold the same values, cells of skipped tiles are NaN.
+    """
+    if len(tile_datasets) == 1:
+        return tile_datasets[0]
+
+    return xr.merge(tile_datasets, compat='no_conflicts', join='outer', combine_attrs='override')
+
+def check_coverage_payload(payload):
+    """
+    Raise a ValueError if a payload is not a decodable NetCDF coverage, e.g. an OWS ExceptionReport or a truncated response
+    """
+    if not payload.startswith(NETCDF_SIGNATURES):
+        raise ValueError(f'Coverage payload is not NetCDF: {payload[:200]!r}')
+    try:
+        with xr.open_dataset(payload):
+            pass
+    except Exception as e:
+        raise ValueError(f'Coverage payload could not be decoded: {e}') from e
+
+def get_coverage(wcs_session, layer_name, reference_time, time_, subsets=DEFAULT_SUBSETS, cache_dir=None, dimensions=None,
+                 geomet_url=GEOMET_URL, timeout=300):
+    """
+    Get the NetCDF payload of a coverage, from the cache when the same request was already made to the same service.
+
+    wcs_session is a callable returning the WCS service, so no connection is made when the payload is cached.
+    dimensions holds any other request parameters of the coverage, e.g. the ensemble member.
+    timeout is the number of seconds to wait for the response, a slower response raises and is retried.
+    Payloads are checked before they are cached (see check_coverage_payload), an invalid payload raises a ValueError
+    and is never written to the cache, so the retries request it again.
+    """
+    dimensions = dimensions or {}
+
+    if cache_dir is not None:
+        key_params = dict(url=geomet_url, layer=layer_name, reference_time=reference_time, time=time_, subsets=subsets)
+        if dimensions:
+            key_params['dimensions'] = dimensions
+        key = cache_key(**key_params)
+        payload = read_cached_coverage(cache_dir, key)
+        if payload is not None:
+            try:
+                check_coverage_payload(payload)
+                logger.info(f'Using cached coverage for {layer_name} {reference_time} time {time_}')
+                return payload
+            except ValueError as e:
+                logger.warning(f'Invalid cached coverage for {layer_name} {reference_time} time {time_}, requested again: {e}')
+
+    response = wcs_session().getCoverage(identifier=[layer_name],
+                                         format='image/netcdf',
+                                         subsettingcrs='EPSG:4326',
+                                         subsets=subsets,
+                                         DIM_REFERENCE_TIME=reference_time,
+                                         TIME=time_,
+                                         timeout=timeout,
+                                         **dimensions)
+    payload = response.read()
+    check_coverage_payload(payload)
+
+    if cache_dir is not None:
+        write_cached_coverage(cache_dir, key, payload)
+
+    return payload
+
+def lead_store_path(store_dir, layer_name, reference_time, time_, tile=0):
+    """
+    Path of a single coverage in the on-disk lead store: {store_dir}/{layer}/{reference_time}/{time}_{tile}.nc
+    """
+    def safe(timestamp):
+        return re.sub(r'[^0-9A-Za-z]', '', timestamp)
+
+    return Path(store_dir, layer_name, safe(reference_time), f'{safe(time_)}_{tile}.nc')
+
+def open_coverage(payload, store_path=None, chunks=None):
+    """
+    Decode a coverage payload.
+
+    Without a store_path the coverage is loaded in memory. With a store_path the payload is written to disk as is
+    and opened as a dask backed Dataset, so its values are only read chunk by chunk when they are computed.
+    """
+    if store_path is None:
+        return xr.open_dataset(payload).load()
+
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = store_path.with_suffix(f'.{threading.get_ident()}.tmp')
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, store_path)
+
+    return xr.open_dataset(store_path, chunks=chunks if chunks is not None else {})
+
+def query_wcs_service_for_analysis_data(layer_name, login, newest_analysis, iso_format="%Y-%m-%dT%H:%M:%SZ",
+                                        geomet_url=GEOMET_URL, cache_dir=None, max_cache_bytes=None, store_dir=None, chunks=None,
+                                        tiles=None, max_workers=8, stations_df=None):
+    """
+    Query the WCS service for the analysis data
+
+    With a store_dir the analysis is kept on disk and returned as a dask backed Dataset (see open_coverage).
+    With tiles (see tile_subsets) the tiles are requested in parallel and stitched, otherwise DEFAULT_SUBSETS is requested.
+    With stations_df the analysis is reduced to the stations, as in query_wcs_service_for_forecast_data.
+    With a cache_dir the coverages are cached, and the cache is evicted above max_cache_bytes once the tiles are fetched.
+    """
+    tiles = tiles if tiles is not None else [DEFAULT_SUBSETS]
+    reduce_tile = _tile_station_reducer(tiles, stations_df)
+
+    thread_data = threading.local()
+
+    def wcs_session():
+        if not hasattr(thread_data, 'wcs'):
+            thread_data.wcs = connect_to_wcs_service(layer_name, login, geomet_url)
+        return thread_data.wcs
+
+    def fetch_tile(tile):
+        payload = get_coverage(wcs_session, layer_name, newest_analysis, newest_analysis, subsets=tiles[tile],
+                               cache_dir=cache_dir, geomet_url=geomet_url)
+        store_path = lead_store_path(store_dir, layer_name, newest_analysis, newest_analysis, tile) if store_dir is not None else None
+        return reduce_tile(tile, open_coverage(payload, store_path, chunks))
+
+    combine_tiles = stitch_tiles if stations_df is None else concat_station_tiles
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        ds = combine_tiles(list(executor.map(fetch_tile, range(len(tiles)))))
+    if cache_dir is not None and max_cache_bytes is not None:
+        evict_coverages(cache_dir, max_cache_bytes)
+    ds = ds.expand_dims(time=[datetime.strptime(newest_analysis, iso_format)])
+    
+    return ds
+
+def _tile_station_reducer(tiles, stations_df=None):
+    """
+    Function reducing the coverage of a tile to the stations it holds, with the station grid index of each tile
+    built once and shared by the worker threads. Coverages are returned as is without stations_df.
+    """
+    if stations_df is None:
+        return lambda tile, ds: ds
+
+    index_lock = threading.Lock()
+    tile_indices = {}
+
+    def reduce_tile(tile, ds):
+        with index_lock:
+            if tile not in tile_indices:
+                tile_indices[tile] = build_station_grid_index(_stations_on_tile(stations_df, tiles[tile]), ds)
+        return extract_stations_from_grid(tile_indices[tile], ds).load()
+
+    return reduce_tile
+
+def _fetch_lead_time(wcs_session, layer_name, newest_fcast, hr, max_retries, retry_backoff, cache_dir=None, dimensions=None,
+                     store_dir=None, chunks=None, subsets=DEFAULT_SUBSETS, tile=0, geomet_url=GEOMET_URL,
+                     timeout=300):
+    """
+    Fetch the coverage for a single lead time (and tile), retrying with exponential backoff
+    """
+    store_path = lead_store_path(store_dir, layer_name, newest_fcast, hr, tile) if store_dir is not None else None
+    for attempt in range(1, max_retries + 1):
+        try:
+            payload = get_coverage(wcs_session, layer_name, newest_fcast, hr, subsets=subsets,
+                                   cache_dir=cache_dir, dimensions=dimensions,
+                                   geomet_url=geomet_url, timeout=timeout)
+            ds = open_coverage(payload, store_path, chunks)
+            return ds, attempt
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * 2 ** (attempt - 1)
+            logger.warning(f'Lead time {hr} failed on attempt {attempt} ({e}), retrying in {delay:.1f} s')
+            time.sleep(delay)
+
+def local_forecast_times(fcasthrs):
+    """
+    Lead times of a forecast, published in UTC, in the local time of the stations (LOCAL_TIME_ZONE) without time zone
+    """
+    times = pd.DatetimeIndex(fcasthrs)
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+
+    return times.tz_convert(LOCAL_TIME_ZONE).tz_localize(None)
+
+def query_wcs_service_for_forecast_data(layer_name, login, newest_fcast, fcasthrs, iso_format="%Y-%m-%dT%H:%M:%SZ",
+                                        geomet_url=GEOMET_URL, max_workers=8, max_retries=3, retry_backoff=2.0,
+                                        allow_missing=False, return_report=False, cache_dir=None, max_cache_bytes=None,
+                                        store_dir=None, chunks=None, tiles=None, stations_df=None, timeout=300):
+    """
+    Query the WCS service for every forecast lead time (and tile) with a bounded pool of workers
+
+    Args:
+    layer_name (str): Name of the forecast layer.
+    login (dict): Username and Password for the GeoMet services.
+    newest_fcast (str): Reference time of the forecast.
+    fcasthrs (list): Datetimes of the forecast lead times.
+    geomet_url (str): Base url of the GeoMet service.
+    max_workers (int): Maximum number of concurrent requests, each worker holds its own WCS session.
+    max_retries (int): Number of attempts for each lead time before it is considered missing.
+    retry_backoff (float): Delay in seconds before the first retry, doubled on each following retry.
+    allow_missing (bool): If True, missing lead times are kept as NaN filled gaps and listed in the
+        'missing_lead_times' attribute. If False, a missing lead time raises a RuntimeError.
+    return_report (bool): If True, also return a DataFrame with the timing and status of each lead time.
+    cache_dir (str or Path): Optional cache directory, lead times already fetched for this reference time are read from it.
+    max_cache_bytes (int): Size above which the least recently used cached coverages are evicted, once all lead times are fetched.
+    store_dir (str or Path): Optional lead store directory. If given, each lead time is written straight to disk and
+        the forecast is returned as a lazy dask backed Dataset, so extraction and to_netcdf run out-of-core.
+    chunks (dict): Chunk sizes of the lazy Dataset, e.g. {'lat': 512, 'lon': 512}. One chunk per lead time if None.
+    tiles (list): Optional WCS subsets of the tiles of the domain (see tile_subsets). The tiles of every lead time
+        are requested in parallel and stitched. DEFAULT_SUBSETS is requested if None.
+    stations_df (DataFrame): Optional station locations (nsrps_stn_locations.csv). If given, each coverage is reduced
+        to the stations it holds as soon as it is fetched, and the forecast has a station dimension instead of lat/lon.
+        Used with the tiles of station_windows, only the cells around the stations are downloaded.
+    timeout (float): Seconds to wait for each coverage response before the attempt fails and is retried.
+
+    Returns:
+    Dataset: The forecast for all lead times, concatenated along time (and the report if return_report).
+    """
+    fcasthrs_str = [datetime.strftime(hr, iso_format) for hr in fcasthrs]
+
+    # One WCS session per worker thread, the owslib client is not shared between threads
+    thread_data = threading.local()
+
+    def wcs_session():
+        if not hasattr(thread_data, 'wcs'):
+            thread_data.wcs = connect_to_wcs_service(layer_name, login, geomet_url)
+        return thread_data.wcs
+
+    tiles = tiles if tiles is not None else [DEFAULT_SUBSETS]
+    reduce_tile = _tile_station_reducer(tiles, stations_df)
+
+    def fetch_data(task):
+        hr, tile = task
+        logger.info(f'Querying {newest_fcast} lead time {hr} tile {tile}')
+        start = time.perf_counter()
+        try:
+            ds, attempts = _fetch_lead_time(wcs_session, layer_name, newest_fcast, hr, max_retries, retry_backoff,
+                                            cache_dir, store_dir=store_dir, chunks=chunks,
+                                            subsets=tiles[tile], tile=tile, geomet_url=geomet_url, timeout=timeout)
+            ds = reduce_tile(tile, ds)
+            return ds, {'lead_time': hr, 'status': 'ok', 'attempts': attempts,
+                        'seconds': time.perf_counter() - start, 'error': None}
+        except Exception as e:
+            return None, {'lead_time': hr, 'status': 'missing', 'attempts': max_retries,
+                          'seconds': time.perf_counter() - start, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tile_results = list(executor.map(fetch_data, [(hr, tile) for hr in fcasthrs_str for tile in range(len(tiles))]))
+    if cache_dir is not None and max_cache_bytes is not None:
+        evict_coverages(cache_dir, max_cache_bytes)
+
+    # A lead time is missing if any of its tiles is missing
+    results = []
+    for i, hr in enumerate(fcasthrs_str):
+        lead_results = tile_results[i * len(tiles):(i + 1) * len(tiles)]
+        errors = [lead_report['error'] for ds, lead_report in lead_results if lead_report['status'] == 'missing']
+        lead_report = {'lead_time': hr, 'status': 'missing' if errors else 'ok',
+                       'attempts': max(lead_report['attempts'] for ds, lead_report in lead_results),
+                       'seconds': sum(lead_report['seconds'] for ds, lead_report in lead_results),
+                       'error': '; '.join(errors) if errors else None}
+        combine_tiles = stitch_tiles if stations_df is None else concat_station_tiles
+        ds = combine_tiles([ds for ds, tile_report in lead_results]) if not errors else None
+        results.append((ds, lead_report))
+
+    report = pd.DataFrame([lead_report for ds, lead_report in results])
+    missing = report.loc[report['status'] == 'missing', 'lead_time'].tolist()
+    logger.info(f'Fetched {len(report) - len(missing)} of {len(report)} lead times in {report["seconds"].sum():.1f} s of requests')
+
+    if len(missing) == len(report):
+        raise RuntimeError(f'No lead times could be retrieved for {layer_name} {newest_fcast}')
+    if missing:
+        if not allow_missing:
+            raise RuntimeError(f'{len(missing)} lead times could not be retrieved for {layer_name} {newest_fcast}: {missing}')
+        logger.warning(f'{len(missing)} lead times missing for {layer_name} {newest_fcast}, filled with NaN: {missing}')
+
+    # Replace missing lead times with NaN filled slices, so gaps stay explicit in the time dimension
+    template = next(ds for ds, lead_report in results if ds is not None)
+    arrys = []
+    for (ds, lead_report), hr in zip(results, local_forecast_times(fcasthrs)):
+        if ds is None:
+            ds = template.where(False)
+        arrys.append(ds.expand_dims(time=[hr]))
+
+    fcasts = xr.concat(arrys, dim='time')
+    fcasts.attrs['missing_lead_times'] = ','.join(missing)
+
+    if return_report:
+        return fcasts, report
+
+    return fcasts
+    
+
+def query_wcs_service_for_ensemble_at_stations(layer_name, login, newest_fcast, fcasthrs, members, stations_df, variable='Band1',
+                                               member_parameter='DIM_MEMBER', iso_format="%Y-%m-%dT%H:%M:%SZ", geomet_url=GEOMET_URL,
+                                               max_workers=8, max_retries=3, retry_backoff=2.0, cache_dir=None, max_cache_bytes=None,
+                                               subsets=None):
+    """
+    Query an ensemble forecast member by member, keeping only the values at the station locations.
+
+    Each member and lead time coverage is decoded, gathered at the stations and released, so at most
+    max_workers grid slices are held in memory at any time, never the full ensemble grid.
+
+    Args:
+    layer_name (str): Name of the ensemble forecast layer.
+    newest_fcast (str): Reference time of the forecast.
+    fcasthrs (list): Datetimes of the forecast lead times.
+    members (list): Ensemble members to retrieve.
+    stations_df (DataFrame): Station locations (nsrps_stn_locations.csv).
+    variable (str): Name of the data variable in the coverages.
+    member_parameter (str): Request parameter selecting the member of the coverage.
+    subsets (list): WCS subsets of the request, the extent of the stations if None.
+
+    Returns:
+    DataArray: The forecast discharge with member, time and station dimensions. Missing member lead times are NaN.
+    """
+    fcasthrs_str = [datetime.strftime(hr, iso_format) for hr in fcasthrs]
+    subsets = subsets if subsets is not None else extent_subsets(station_extent(stations_df))
+
+    thread_data = threading.local()
+
+    def wcs_session():
+        if not hasattr(thread_data, 'wcs'):
+            thread_data.wcs = connect_to_wcs_service(layer_name, login, geomet_url)
+        return thread_data.wcs
+
+    # The station grid index is built from the first slice retrieved, all slices share the grid
+    index_lock = threading.Lock()
+    station_index = {}
+
+    def fetch_stations(member, hr):
+        try:
+            ds, attempts = _fetch_lead_time(wcs_session, layer_name, newest_fcast, hr, max_retries, retry_backoff,
+                                            cache_dir, dimensions={member_parameter: member}, subsets=subsets,
+                                            geomet_url=geomet_url)
+        except Exception as e:
+            logger.warning(f'Member {member} lead time {hr} missing: {e}')
+            return None
+        with index_lock:
+            if 'grid' not in station_index:
+                station_index['grid'] = build_station_grid_index(stations_df, ds, cache_dir)
+        values = extract_stations_from_grid(station_index['grid'], ds)[variable].values.reshape(-1)
+        ds.close()
+        return values
+
+    member_values = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for member in members:
+            logger.info(f'Querying {newest_fcast} member {member}')
+            member_values.append(list(executor.map(lambda hr: fetch_stations(member, hr), fcasthrs_str)))
+    if cache_dir is not None and max_cache_bytes is not None:
+        evict_coverages(cache_dir, max_cache_bytes)
+
+    if 'grid' not in station_index:
+        raise RuntimeError(f'No member lead times could be retrieved for {layer_name} {newest_fcast}')
+
+    station_numbers = station_index['grid']['STATION_NUMBER'].values
+    ensemble = np.full((len(members), len(fcasthrs), len(station_numbers)), np.nan, dtype=np.float32)
+    for i, lead_values in enumerate(member_values):
+        for j, values in enumerate(lead_values):
+            if values is not None:
+                ensemble[i, j] = values
+
+    times = local_forecast_times(fcasthrs)
+
+    return xr.DataArray(ensemble, dims=('member', 'time', 'station'),
+                        coords={'member': list(members), 'time': times, 'station': station_numbers},
+                        name='Discharge')
+
+def extract_station_from_grid(station, input_ds):
+    """
+    Extract from the grided data for a given station
+    """
+    from shapely.geometry import Point
+
+    # Extract the station location
+    station_location = Point(station[1]['MODEL_LONGITUDE'], station[1]['MODEL_LATITUDE'])
+
+    # Extract the station data
+    station_data = input_ds.sel(lon=station_location.x, lat=station_location.y, method='nearest')
+
+    return station_data
+
+def grid_definition_key(input_ds):
+    """
+    Hash the lat/lon coordinates of a gridded dataset, identifying its grid definition
+    """
+    grid_hash = hashlib.sha1()
+    for coord in ['lat', 'lon']:
+        grid_hash.update(np.ascontiguousarray(input_ds[coord].values, dtype=np.float64).tobytes())
+
+    return grid_hash.hexdigest()[:16]
+
+def _nearest_cell_indices(coord_values, points):
+    """
+    Nearest cell index along one coordinate for each point, -1 where the point falls outside the grid
+    """
+    coord_index = pd.Index(coord_values)
+    indices = coord_index.get_indexer(points, method='nearest')
+
+    # Points further than half a cell from the grid edge are not on the grid
+    half_cell = np.abs(np.diff(coord_values)).max() / 2 if len(coord_values) > 1 else 0
+    outside = np.abs(coord_values[indices] - points) > half_cell
+    indices[outside] = -1
+
+    return indices
+
+def build_station_grid_index(stations_df, input_ds, cache_dir=None):
+    """
+    Build the lat/lon cell indices of every station on the grid of input_ds.
+
+    Args:
+    stations_df (DataFrame): Station locations with STATION_NUMBER, MODEL_LATITUDE and MODEL_LONGITUDE columns (nsrps_stn_locations.csv).
+    input_ds (Dataset): Gridded dataset with lat and lon coordinates.
+    cache_dir (str or Path): Optional directory where the index is cached, keyed by the grid definition.
+
+    Returns:
+    DataFrame: The station locations with LAT_INDEX and LON_INDEX columns, for the stations that fall on the grid.
+    """
+    station_columns = ['STATION_NUMBER', 'MODEL_LATITUDE', 'MODEL_LONGITUDE']
+    stations_df = stations_df[station_columns].reset_index(drop=True)
+
+    if cache_dir is not None:
+        station_hash = hashlib.sha1(pd.util.hash_pandas_object(stations_df, index=False).values.tobytes()).hexdigest()[:8]
+        cache_path = Path(cache_dir, f'station_grid_index_{grid_definition_key(input_ds)}_{station_hash}.csv')
+        if cache_path.exists():
+            logger.info(f'Station grid index read from {cache_path}')
+            return pd.read_csv(cache_path, dtype={'STATION_NUMBER': str})
+
+    lat_index = _nearest_cell_indices(input_ds['lat'].values, stations_df['MODEL_LATITUDE'].values)
+    lon_index = _nearest_cell_indices(input_ds['lon'].values, stations_df['MODEL_LONGITUDE'].values)
+
+    station_grid_index = stations_df.assign(LAT_INDEX=lat_index, LON_INDEX=lon_index)
+    station_grid_index = station_grid_index[(lat_index >= 0) & (lon_index >= 0)].reset_index(drop=True)
+
+    if cache_dir is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        station_grid_index.to_csv(cache_path, index=False)
+        logger.info(f'Station grid index output to {cache_path}')
+
+    return station_grid_index
+
+def extract_stations_from_grid(station_grid_index, input_ds, stations=None):
+    """
+    Extract all stations from the gridded data in a single vectorised gather
+
+    Args:
+    station_grid_index (DataFrame): Output of build_station_grid_index for the grid of input_ds.
+    input_ds (Dataset): Gridded dataset with lat and lon dimensions.
+    stations (list): Optional subset of station numbers to extract.
+
+    Returns:
+    Dataset: The gridded variables with the lat and lon dimensions replaced by a station dimension.
+    """
+    if stations is not None:
+        station_grid_index = station_grid_index[station_grid_index['STATION_NUMBER'].isin(stations)]
+
+    station_numbers = station_grid_index['STATION_NUMBER'].values
+    lat_index = xr.DataArray(station_grid_index['LAT_INDEX'].values, dims='station', coords={'station': station_numbers})
+    lon_index = xr.DataArray(station_grid_index['LON_INDEX'].values, dims='station', coords={'station': station_numbers})
+
+    return input_ds.isel(lat=lat_index, lon=lon_index)
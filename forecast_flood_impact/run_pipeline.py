@@ -0,0 +1,565 @@
+# Description: Headless entry point running the complete workflow, from observation retrieval to rendering, with a JSON run report.
+#
+# Usage: python -m forecast_flood_impact.run_pipeline --config settings/general_settings.yaml [--stages observations,nsrps_fetch,...]
+import argparse
+import configparser
+import json
+import logging
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from .scalar_data_access import retrieve_data_from_api_parallel, read_station_csv
+from .bias_correction import bias_correct_forecasts, LOCAL_TIME_ZONE
+from .calculate_return_periods import classify_return_periods
+from .threshold_registry import load_threshold_registry
+# The GeoMet (xarray, owslib), store (pyarrow) and plotting (matplotlib, cartopy) backends are
+# imported by the stages using them, so runs of the other stages start quickly
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STAGES = ['observations', 'nsrps_fetch', 'analysis_archive', 'extraction', 'bias_correction', 'classification', 'alerts', 'rendering', 'map']
+
+# Observation collections retrieved for each station, with their datetime column
+OBSERVATION_COLLECTIONS = {'hydrometric-realtime': 'DATETIME', 'hydrometric-daily-mean': 'DATE'}
+
+def load_settings(config_file):
+    """
+    Read the settings, resolving the paths relative to the directory of the settings file
+    """
+    config_file = Path(config_file).resolve()
+    with open(config_file, 'r') as ymlfile:
+        config = yaml.load(ymlfile, Loader=yaml.FullLoader)
+
+    config['paths'] = {name: (config_file.parent / path).resolve() for name, path in config['paths'].items()}
+
+    return config
+
+def load_login(config):
+    """
+    Username and Password for the GeoMet services, from the login config file when it exists
+    """
+    login_config = config['paths'].get('login_config')
+    if login_config is not None and Path(login_config).exists():
+        parser = configparser.ConfigParser()
+        parser.read(login_config)
+        return parser['Login']
+
+    return {'Username': None, 'Password': None}
+
+def _files_metrics(paths):
+    """
+    Number of data rows and bytes of a list of csv, Parquet or NetCDF files
+    """
+    rows = 0
+    n_bytes = 0
+    for path in paths:
+        path = Path(path)
+        if not path.exists():
+            continue
+        n_bytes += path.stat().st_size
+        if path.suffix == '.csv':
+            with open(path, 'rb') as f:
+                rows += sum(1 for _ in f) - 1
+        elif path.suffix == '.parquet':
+            import pyarrow.parquet as pq
+            rows += pq.read_metadata(path).num_rows
+
+    return {'rows': rows, 'bytes': n_bytes}
+
+def _station_store_dir(context):
+    """
+    Station store of the station series of the run, None if they are written to per-station csv files
+    """
+    config = context['config']
+    if config.get('station_store_settings', {}).get('format', 'csv') != 'store':
+        return None
+    return config['paths']['station_store']
+
+def _write_station_series(context, df, collection, variable, station, append=False):
+    """
+    Write the series of a station to the station store, or to its csv file {output_dir}/{collection}/{station}_{variable}.csv
+
+    Returns:
+    list: The files written.
+    """
+    store_dir = _station_store_dir(context)
+    if store_dir is not None:
+        from .station_store import write_station_data, station_partition_dir
+        write_station_data(df, store_dir, collection, variable, station, append=append,
+                           max_parts=context['config']['station_store_settings'].get('max_parts', 32))
+        return sorted(station_partition_dir(store_dir, collection, variable, station).glob('*.parquet'))
+
+    csv_path = Path(context['output_dir'], collection, f'{station}_{variable}.csv')
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(csv_path)
+    return [csv_path]
+
+def _read_station_series(context, collection, variable, datetime_column, stations=None, start=None):
+    """
+    Series of the stations in the local time of the NSRPS forecasts, in long format with a STATION_NUMBER column.
+    From the station store, in one read filtered on the stations and start time, or from the station csv files.
+
+    Args:
+    start (Timestamp): Optional start of the series, in local time.
+
+    Returns:
+    DataFrame: The series, empty if no station has data.
+    """
+    stations = context['stations'] if stations is None else stations
+    store_dir = _station_store_dir(context)
+
+    if store_dir is not None:
+        from .station_store import read_station_data, station_partition_dir
+        stored = [station for station in stations if station_partition_dir(store_dir, collection, variable, station).exists()]
+        if not stored:
+            return pd.DataFrame(columns=['STATION_NUMBER'])
+        # The observations of the OGC API are stored in UTC, the NSRPS series in local time
+        if start is not None and collection in OBSERVATION_COLLECTIONS:
+            start = pd.Timestamp(start).tz_localize(LOCAL_TIME_ZONE)
+        df = read_station_data(store_dir, collection, variable, stored, start=start)
+        df['STATION_NUMBER'] = df['STATION_NUMBER'].astype(str)
+    else:
+        frames = []
+        for station in stations:
+            csv_path = Path(context['output_dir'], collection, f'{station}_{variable}.csv')
+            if csv_path.exists():
+                frames.append(read_station_csv(csv_path, datetime_column).assign(STATION_NUMBER=station))
+        if not frames:
+            return pd.DataFrame(columns=['STATION_NUMBER'])
+        df = pd.concat(frames)
+
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+        df.index = df.index.tz_convert(LOCAL_TIME_ZONE).tz_localize(None)
+    if start is not None:
+        df = df[df.index >= pd.Timestamp(start).tz_localize(None)]
+
+    return df
+
+def _nsrps_stations(context):
+    """
+    Model locations of the stations of the run
+    """
+    config = context['config']
+    nsrps_stations_df = pd.read_csv(Path(config['paths']['gis_data'], config['gis_data']['nsrps_stns_csv']))
+
+    return nsrps_stations_df[nsrps_stations_df['STATION_NUMBER'].isin(context['stations'])]
+
+def _request_tiles(context):
+    """
+    WCS tiles of the run, covering the extent of the stations or of the basins shapefile,
+    or only the windows around the stations in points fetch mode
+    """
+    from .nsrps_data_access import station_extent, basin_extent, tile_subsets, station_windows
+
+    config = context['config']
+    settings = config['geomet_settings']
+    buffer = settings.get('extent_buffer', 0.05)
+    nsrps_stations_df = _nsrps_stations(context)
+
+    if settings.get('fetch_mode', 'grid') == 'points':
+        return station_windows(nsrps_stations_df, settings.get('window_size', 0.25), settings.get('window_margin', 0.02))
+
+    if settings.get('extent', 'stations') == 'basins':
+        extent = basin_extent(Path(config['paths']['gis_data'], config['gis_data']['basins_shp']), buffer)
+    else:
+        extent = station_extent(nsrps_stations_df, buffer)
+
+    return tile_subsets(extent, settings.get('tile_size'), nsrps_stations_df, buffer)
+
+def run_observations(context):
+    config = context['config']
+    settings = config['msc_open_data_settings']
+    output_dir = context['output_dir']
+
+    store_dir = _station_store_dir(context)
+
+    written = []
+    for collection, datetime_column in OBSERVATION_COLLECTIONS.items():
+        stations = retrieve_data_from_api_parallel(context['stations'], collection, context['variable'], datetime_column,
+                                                   settings['api_url'], output_dir,
+                                                   page_size=settings.get('page_size', 10000),
+                                                   max_workers=settings.get('max_workers', 4),
+                                                   incremental=settings.get('incremental', False),
+                                                   store_dir=store_dir,
+                                                   max_retries=settings.get('max_retries', 3),
+                                                   retry_backoff=settings.get('retry_backoff', 2.0))
+        if store_dir is not None:
+            from .station_store import station_partition_dir
+            written += [part for station in stations
+                        for part in station_partition_dir(store_dir, collection, context['variable'], station).glob('*.parquet')]
+        else:
+            written += [Path(output_dir, collection, f'{station}_{context["variable"]}.csv') for station in stations]
+
+    return _files_metrics(written)
+
+def run_nsrps_fetch(context):
+    from .nsrps_data_access import (query_wms_service_for_forecast_times, query_wms_service_for_analysis_times,
+                                   query_wcs_service_for_forecast_data, query_wcs_service_for_analysis_data)
+
+    config = context['config']
+    settings = config['geomet_settings']
+    output_dir = context['output_dir']
+    login = context['login']
+    cache_options = {'geomet_url': settings['url'], 'cache_dir': config['paths']['cache_dir']}
+
+    # In lazy mode the lead times are kept on disk and written to the output file chunk by chunk
+    lazy_options = {}
+    if settings.get('lazy', False):
+        lazy_options = {'store_dir': Path(config['paths']['cache_dir'], 'lead_store'), 'chunks': settings.get('chunks')}
+
+    tile_options = {'tiles': _request_tiles(context)}
+    # In points fetch mode the coverages are reduced to the stations as they are fetched
+    if settings.get('fetch_mode', 'grid') == 'points':
+        tile_options['stations_df'] = _nsrps_stations(context)
+
+    forecast_layer = settings['forecast_layer']
+    newest_fcast, fcasthrs = query_wms_service_for_forecast_times(forecast_layer, login, capabilities_ttl=settings['capabilities_ttl'], **cache_options)
+    forecast_ds = query_wcs_service_for_forecast_data(forecast_layer, login, newest_fcast, fcasthrs,
+                                                      max_workers=settings['max_workers'], max_retries=settings['max_retries'],
+                                                      retry_backoff=settings['retry_backoff'], max_cache_bytes=settings['max_cache_bytes'],
+                                                      **tile_options, **cache_options, **lazy_options)
+    forecast_nc = Path(output_dir, forecast_layer, f'{newest_fcast}.nc')
+    forecast_nc.parent.mkdir(parents=True, exist_ok=True)
+    forecast_ds.to_netcdf(forecast_nc)
+    forecast_ds.close()
+
+    analysis_layer = settings['analysis_layer']
+    analysis_time = query_wms_service_for_analysis_times(analysis_layer, login, capabilities_ttl=settings['capabilities_ttl'], **cache_options)
+    analysis_ds = query_wcs_service_for_analysis_data(analysis_layer, login, analysis_time,
+                                                      max_cache_bytes=settings['max_cache_bytes'],
+                                                      max_workers=settings['max_workers'], **tile_options, **cache_options, **lazy_options)
+    analysis_nc = Path(output_dir, analysis_layer, f'{analysis_time}.nc')
+    analysis_nc.parent.mkdir(parents=True, exist_ok=True)
+    analysis_ds.to_netcdf(analysis_nc)
+    analysis_ds.close()
+
+    if lazy_options:
+        shutil.rmtree(lazy_options['store_dir'], ignore_errors=True)
+
+    context['gridded_files'] = {forecast_layer: (forecast_nc, 'forecast'), analysis_layer: (analysis_nc, 'analysis')}
+
+    metrics = _files_metrics([forecast_nc, analysis_nc])
+    metrics['rows'] = forecast_ds.sizes['time'] + analysis_ds.sizes['time']
+
+    return metrics
+
+def run_analysis_archive(context):
+    from .analysis_archive import backfill_analysis_archive
+
+    config = context['config']
+    settings = config['geomet_settings']
+    stations_df = _nsrps_stations(context)
+
+    appended = backfill_analysis_archive(settings['analysis_layer'], context['login'], stations_df, config['paths']['station_store'],
+                                         geomet_url=settings['url'], max_workers=settings['max_workers'],
+                                         cache_dir=config['paths']['cache_dir'], max_cache_bytes=settings['max_cache_bytes'],
+                                         capabilities_ttl=settings['capabilities_ttl'])
+
+    return {'rows': len(appended) * len(stations_df), 'cycles': len(appended)}
+
+def run_extraction(context):
+    import xarray as xr
+    from .nsrps_data_access import build_station_grid_index, extract_stations_from_grid
+
+    config = context['config']
+
+    nsrps_stations_df = _nsrps_stations(context)
+
+    # In lazy mode only the chunks holding stations are read
+    chunks = (config['geomet_settings'].get('chunks') or {}) if config['geomet_settings'].get('lazy', False) else None
+
+    written = []
+    for layer_name, (nc_path, suffix) in context['gridded_files'].items():
+        with xr.open_dataset(nc_path, chunks=chunks) as gridded_ds:
+            if 'station' in gridded_ds.dims:
+                # Already reduced to the stations in points fetch mode
+                stations_ds = gridded_ds.sel(station=gridded_ds['station'].isin(nsrps_stations_df['STATION_NUMBER'])).load()
+            else:
+                station_grid_index = build_station_grid_index(nsrps_stations_df, gridded_ds, config['paths']['cache_dir'])
+                stations_ds = extract_stations_from_grid(station_grid_index, gridded_ds).load()
+
+        for station in stations_ds['station'].values:
+            station_data_df = stations_ds.sel(station=station).drop_vars('station').to_dataframe()
+            station_data_df.rename(columns={'Band1':'Discharge'}, inplace=True)
+            if suffix == 'analysis':
+                # Each analysis cycle is added to the analysis series of the station, with the columns of the analysis archive
+                written += _write_station_series(context, station_data_df[['Discharge']], layer_name, suffix, station, append=True)
+            else:
+                written += _write_station_series(context, station_data_df, layer_name, suffix, station)
+
+    return _files_metrics(written)
+
+def run_bias_correction(context):
+    import xarray as xr
+
+    config = context['config']
+    settings = config.get('bias_correction_settings', {})
+    forecast_layer = config['geomet_settings']['forecast_layer']
+
+    measurements_df = _read_station_series(context, 'hydrometric-realtime', context['variable'], 'DATETIME')
+    forecasts_df = _read_station_series(context, forecast_layer, 'forecast', 'time')
+    stations = set(measurements_df['STATION_NUMBER']) & set(forecasts_df['STATION_NUMBER'])
+    if not stations:
+        return _files_metrics([])
+
+    # Stations x lead times array of the forecasts, corrected in one pass
+    forecasts_df = forecasts_df[forecasts_df['STATION_NUMBER'].isin(stations)]
+    forecast_df = forecasts_df.set_index('STATION_NUMBER', append=True)['Discharge'].unstack().rename_axis(index='time', columns='station')
+    forecast = xr.DataArray(forecast_df, dims=('time', 'station'))
+    measurements_df = measurements_df[measurements_df['STATION_NUMBER'].isin(stations)]
+    corrected = bias_correct_forecasts(measurements_df[['STATION_NUMBER', 'DISCHARGE']], forecast,
+                                       scheme=settings.get('scheme', 'additive'),
+                                       decay_hours=settings.get('decay_hours', 24.0))
+
+    written = []
+    for station in corrected['station'].values:
+        forecast_bias_corrected_df = corrected.sel(station=station).drop_vars(['station', 'overlap_time', 'correction']).to_dataframe(name='Discharge')
+        written += _write_station_series(context, forecast_bias_corrected_df, forecast_layer, 'forecast_bias_corrected', station)
+
+    return _files_metrics(written)
+
+def run_classification(context):
+    config = context['config']
+    output_dir = context['output_dir']
+    forecast_layer = config['geomet_settings']['forecast_layer']
+    ffa_dir = config['paths']['flood_frequency_analysis']
+    threshold_registry = load_threshold_registry(Path(ffa_dir, config['flood_frequency_analysis']['threshold_csv']), Path(ffa_dir))
+
+    realtime_df = _read_station_series(context, 'hydrometric-realtime', context['variable'], 'DATETIME')
+    # The bias corrected forecast of a station, or its raw forecast when it could not be corrected
+    corrected_df = _read_station_series(context, forecast_layer, 'forecast_bias_corrected', 'time')
+    uncorrected = [station for station in context['stations'] if station not in set(corrected_df['STATION_NUMBER'])]
+    uncorrected_df = _read_station_series(context, forecast_layer, 'forecast', 'time', stations=uncorrected)
+
+    discharge_frames = [realtime_df[['DISCHARGE', 'STATION_NUMBER']]] if not realtime_df.empty else []
+    discharge_frames += [forecast_df[['Discharge', 'STATION_NUMBER']].rename(columns={'Discharge': 'DISCHARGE'})
+                         for forecast_df in (corrected_df, uncorrected_df) if not forecast_df.empty]
+
+    if not discharge_frames:
+        logger.warning('No observations or forecasts of the stations to classify')
+        return _files_metrics([])
+
+    discharge_df = pd.concat(discharge_frames)
+    return_level_df = classify_return_periods(discharge_df, threshold_registry)
+    # Continuous return period of every observed and forecasted step, interpolated on the fitted frequency curves
+    return_level_df['RETURN_PERIOD'] = threshold_registry.return_periods(discharge_df['STATION_NUMBER'].to_numpy(),
+                                                                         discharge_df['DISCHARGE'].to_numpy(dtype=float))
+
+    # The return periods are kept as csv files, the products read by the station map and the notebooks
+    output_return_period_dir = Path(output_dir, 'observed_and_forecasted_return_periods')
+    output_return_period_dir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    for station, station_return_level_df in return_level_df.groupby('STATION_NUMBER', observed=True):
+        csv_path = Path(output_return_period_dir, f'{station}_return_periods.csv')
+        station_return_level_df[['Exceedance', 'RETURN_PERIOD']].to_csv(csv_path)
+        written.append(csv_path)
+
+    return _files_metrics(written)
+
+def _forecast_reference_time(context):
+    """
+    Reference time of the forecast of the run, the name of its NetCDF file
+    """
+    forecast_layer = context['config']['geomet_settings']['forecast_layer']
+    if forecast_layer not in context['gridded_files']:
+        return None
+    return pd.Timestamp(context['gridded_files'][forecast_layer][0].stem)
+
+def run_alerts(context):
+    from .alert_engine import AlertEngine, JsonlAlertSink, WebhookAlertSink
+
+    config = context['config']
+    output_dir = context['output_dir']
+    settings = config.get('alert_settings', {})
+    ffa_dir = config['paths']['flood_frequency_analysis']
+    threshold_registry = load_threshold_registry(Path(ffa_dir, config['flood_frequency_analysis']['threshold_csv']), Path(ffa_dir))
+
+    if settings.get('webhook_url'):
+        sink = WebhookAlertSink(settings['webhook_url'])
+    else:
+        sink = JsonlAlertSink(Path(output_dir, 'alerts', 'alerts.jsonl'))
+
+    # The state of the stations is kept between runs, so only the new observations and forecast steps are evaluated
+    state_path = Path(config['paths']['cache_dir'], 'alert_state.json')
+    engine = AlertEngine.load(state_path, threshold_registry, sink)
+
+    # The observations of the stations already evaluated are only read from the earliest of their last evaluated times
+    stations = [station for station in context['stations'] if station in threshold_registry]
+    evaluated = [station for station in stations if engine.state.get(station, {}).get('last_observed_time') is not None]
+    observation_frames = [_read_station_series(context, 'hydrometric-realtime', context['variable'], 'DATETIME',
+                                               stations=[station for station in stations if station not in evaluated])]
+    if evaluated:
+        start = min(engine.state[station]['last_observed_time'] for station in evaluated)
+        observation_frames.append(_read_station_series(context, 'hydrometric-realtime', context['variable'], 'DATETIME',
+                                                       stations=evaluated, start=start))
+    observation_frames = [df[['DISCHARGE', 'STATION_NUMBER']] for df in observation_frames if not df.empty]
+    forecast_df = _read_station_series(context, config['geomet_settings']['forecast_layer'], 'forecast_bias_corrected', 'time',
+                                       stations=stations)
+
+    alerts = []
+    if observation_frames:
+        alerts += engine.update_observations(pd.concat(observation_frames))
+    reference_time = _forecast_reference_time(context)
+    if not forecast_df.empty and reference_time is not None:
+        alerts += engine.update_forecast(forecast_df[['Discharge', 'STATION_NUMBER']], reference_time)
+    engine.save_state(state_path)
+
+    return {'rows': len(alerts), 'stations': len(engine.state)}
+
+def run_rendering(context):
+    from .batch_rendering import render_hydrographs
+
+    config = context['config']
+    output_dir = context['output_dir']
+    settings = config.get('rendering_settings', {})
+    ffa_dir = config['paths']['flood_frequency_analysis']
+
+    render_report = render_hydrographs(context['stations'], output_dir, Path(output_dir, 'hydrographs'), context['variable'],
+                                       formats=tuple(settings.get('formats', ['png'])),
+                                       threshold_csv=Path(ffa_dir, config['flood_frequency_analysis']['threshold_csv']),
+                                       climatology_cache_dir=config['paths']['cache_dir'],
+                                       max_workers=settings.get('max_workers'),
+                                       store_dir=_station_store_dir(context),
+                                       forecast_layer=config['geomet_settings']['forecast_layer'],
+                                       analysis_layer=config['geomet_settings']['analysis_layer'],
+                                       ffa_dir=Path(ffa_dir))
+
+    files = [path for files in render_report['files'] for path in files]
+    metrics = _files_metrics(files)
+    metrics['rows'] = int((render_report['status'] == 'rendered').sum())
+    metrics['failed'] = int((render_report['status'] == 'failed').sum())
+    if metrics['failed'] and metrics['failed'] == len(render_report):
+        raise RuntimeError('No hydrograph could be rendered')
+
+    return metrics
+
+def run_map(context):
+    from .geospatial_plotting import peak_station_classes, render_station_map
+
+    config = context['config']
+    output_dir = context['output_dir']
+    settings = config.get('map_settings', {})
+    gis_data = config['paths']['gis_data']
+    stations_csv = Path(gis_data, config['gis_data']['hydro_stns_csv'])
+
+    station_classes = peak_station_classes(Path(output_dir, 'observed_and_forecasted_return_periods'), context['stations'])
+    map_path = render_station_map(Path(gis_data, config['gis_data']['basins_shp']), Path(gis_data, config['gis_data']['flowlines_shp']),
+                                  stations_csv, Path(output_dir, 'maps', f'station_map.{settings.get("format", "png")}'),
+                                  config['paths']['cache_dir'], station_classes, zoom=settings.get('zoom', 10))
+
+    metrics = _files_metrics([map_path])
+    metrics['rows'] = int(station_classes.notna().sum())
+
+    return metrics
+
+STAGE_FUNCTIONS = {
+    'observations': run_observations,
+    'nsrps_fetch': run_nsrps_fetch,
+    'analysis_archive': run_analysis_archive,
+    'extraction': run_extraction,
+    'bias_correction': run_bias_correction,
+    'classification': run_classification,
+    'alerts': run_alerts,
+    'rendering': run_rendering,
+    'map': run_map,
+}
+
+def _gridded_files_on_disk(config, output_dir):
+    """
+    Most recent forecast and analysis NetCDF files, used when the extraction runs without the fetch stage
+    """
+    gridded_files = {}
+    for layer_key, suffix in [('forecast_layer', 'forecast'), ('analysis_layer', 'analysis')]:
+        layer_name = config['geomet_settings'][layer_key]
+        nc_files = sorted(Path(output_dir, layer_name).glob('*.nc'))
+        if nc_files:
+            gridded_files[layer_name] = (nc_files[-1], suffix)
+
+    return gridded_files
+
+def run_pipeline(config_file, stages=STAGES, variable='DISCHARGE', report_path=None):
+    """
+    Run the stages of the workflow in order, stopping at the first failure.
+
+    Returns:
+    dict: The run report, with the time, rows and bytes of each stage. It is also written as JSON to report_path,
+    by default {output_dir}/run_reports/run_{start time}.json.
+    """
+    config = load_settings(config_file)
+    output_dir = config['paths']['output_dir']
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    hydro_stations_df = pd.read_csv(Path(config['paths']['gis_data'], config['gis_data']['hydro_stns_csv']))
+
+    context = {
+        'config': config,
+        'output_dir': output_dir,
+        'variable': variable,
+        'stations': hydro_stations_df['ID'].tolist(),
+        'gridded_files': _gridded_files_on_disk(config, output_dir),
+    }
+
+    context['login'] = load_login(config)
+
+    started = datetime.now(timezone.utc)
+    report = {'started': started.isoformat(), 'config': str(Path(config_file).resolve()), 'stations': len(context['stations']),
+              'stages': [], 'status': 'ok'}
+
+    for stage in stages:
+        logger.info(f'Running stage {stage}')
+        start = time.perf_counter()
+        stage_report = {'stage': stage}
+        try:
+            stage_report.update(STAGE_FUNCTIONS[stage](context))
+            stage_report['status'] = 'ok'
+        except Exception as e:
+            logger.exception(f'Stage {stage} failed')
+            stage_report.update({'status': 'failed', 'error': str(e)})
+            report['status'] = 'failed'
+        stage_report['seconds'] = round(time.perf_counter() - start, 3)
+        report['stages'].append(stage_report)
+        logger.info(f'Stage {stage} {stage_report["status"]} in {stage_report["seconds"]} s')
+
+        if stage_report['status'] == 'failed':
+            break
+
+    report['total_seconds'] = round(sum(stage_report['seconds'] for stage_report in report['stages']), 3)
+
+    if report_path is None:
+        report_path = Path(output_dir, 'run_reports', f'run_{started.strftime("%Y%m%dT%H%M%SZ")}.json')
+    Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f'Run report output to {report_path}')
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Forecast Flood Impact workflow headless.')
+    parser.add_argument('--config', default=str(Path(__file__).resolve().parents[1] / 'settings' / 'general_settings.yaml'),
+                        help='Path to the settings yaml file.')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'Comma separated stages to run, in order. Default: {",".join(STAGES)}')
+    parser.add_argument('--variable', default='DISCHARGE', help='Hydrometric variable to process.')
+    parser.add_argument('--report', default=None, help='Path of the JSON run report.')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown_stages = [stage for stage in stages if stage not in STAGE_FUNCTIONS]
+    if unknown_stages:
+        parser.error(f'Unknown stages: {unknown_stages}')
+
+    report = run_pipeline(args.config, stages, args.variable, args.report)
+
+    return 0 if report['status'] == 'ok' else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
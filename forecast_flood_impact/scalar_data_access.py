@@ -0,0 +1,465 @@
+# Description: This script contains functions to retrieve scalar data from the Environment and Climate Change Canada (ECCC) API.
+
+import pandas as pd
+import requests
+from pathlib import Path
+import logging
+import copy 
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Station columns repeated on every record
+STATION_COLUMNS = ['STATION_NUMBER', 'STATION_NAME']
+
+def compact_station_frame(df):
+    """
+    Compact in-memory representation of station records, returned as a new frame (df is left unchanged):
+    the repeated station columns as categories, the float values as float32 and the tz-aware datetimes
+    as UTC datetime64, held as int64 epoch nanoseconds.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in STATION_COLUMNS:
+            values = values.astype('category')
+        elif pd.api.types.is_float_dtype(values.dtype):
+            values = values.astype('float32')
+        elif isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert('UTC')
+        columns[column] = values
+
+    compact_df = pd.DataFrame(columns, index=df.index)
+    if isinstance(compact_df.index, pd.DatetimeIndex) and compact_df.index.tz is not None:
+        compact_df.index = compact_df.index.tz_convert('UTC')
+
+    return compact_df
+
+def read_station_csv(csv_path, datetime_column):
+    """
+    Read a station csv file of retrieve_data_from_api in the compact representation of compact_station_frame,
+    with a datetime index.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    df = pd.read_csv(csv_path, dtype={column: 'category' for column in STATION_COLUMNS if column in header})
+
+    times = pd.to_datetime(df.pop(datetime_column), format='ISO8601')
+    df.index = pd.DatetimeIndex(times, name=datetime_column)
+
+    return compact_station_frame(df)
+
+def _last_stored_time(csv_path, datetime_column):
+    """
+    Latest timestamp already stored in a station csv file, formatted for an OGC API time query
+    """
+    stored_times = pd.to_datetime(pd.read_csv(csv_path, usecols=[datetime_column])[datetime_column])
+    return _format_query_time(stored_times.max())
+
+def _format_query_time(last_time):
+    """
+    Timestamp formatted for an OGC API time query, None for a missing timestamp
+    """
+    if pd.isna(last_time):
+        return None
+    if last_time.tzinfo is not None:
+        return last_time.tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%SZ')
+    if last_time == last_time.normalize():
+        return last_time.strftime('%Y-%m-%d')
+    return last_time.strftime('%Y-%m-%dT%H:%M:%S')
+
+def _incremental_time_query(last_time, time_=None):
+    """
+    Time query of the records from the last stored timestamp, up to the end of the time_ query (start/end) if given.
+    None if the records up to that end are already stored.
+    """
+    end_date = time_.split('/')[1] if time_ is not None else '..'
+    if end_date != '..':
+        last, end = pd.Timestamp(last_time), pd.Timestamp(end_date)
+        if last.tzinfo is not None and end.tzinfo is None:
+            end = end.tz_localize('UTC')
+        elif last.tzinfo is None and end.tzinfo is not None:
+            last = last.tz_localize('UTC')
+        if last >= end:
+            return None
+
+    return f"{last_time}/{end_date}"
+
+def _append_to_station_csv(new_data_df, csv_path, datetime_column):
+    """
+    Append newly retrieved records to an existing station csv file, the new records replacing any duplicate timestamps
+    """
+    stored_data_df = pd.read_csv(csv_path, index_col=datetime_column)
+    stored_data_df.index = pd.to_datetime(stored_data_df.index)
+
+    combined_df = pd.concat([stored_data_df, new_data_df])
+    combined_df = combined_df[~combined_df.index.duplicated(keep='last')].sort_index()
+
+    return combined_df
+
+def retrieve_data_from_api(stations, collection, download_variable,datetime_column, api_url, output_dir,other_variables=[],time_limits=False, start_date=None, end_date=None, limit=10000, incremental=False):
+    """
+    Retrieve data for a list of stations from an OGC API Features collection and output a csv file per station.
+
+    With incremental=True, stations that already have a csv file for the collection and variable only
+    request the records from the last stored timestamp onwards, and these are appended to the csv file.
+    With time_limits, the records are only requested up to end_date, and stations already stored up to end_date are skipped.
+    """
+
+    # Set the time limits for the data retrieval
+    if time_limits:
+        time_ = f"{start_date}/{end_date}"
+        logger.info(f"Retrieving {download_variable} from {collection} for the period {time_}")
+    else:
+        logger.info(f"Retrieving {download_variable} from {collection} with no time limits")
+
+    # Set columns to be saved to the dataframe
+    query_variables = [
+                    "STATION_NUMBER",
+                    "STATION_NAME"
+                    ]
+    
+    # Append additional query variables
+    query_variables.append(datetime_column)
+    query_variables.append(download_variable)
+    query_variables = query_variables + other_variables
+    logger.info(f"Query variables: {query_variables}")
+
+    # Output data frame to csv file
+    collection_output_dir = Path(output_dir,collection)
+    collection_output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Output directory: {collection_output_dir}")
+
+    # Instansiate features, owslib is only needed by this sequential retrieval
+    from owslib.ogcapi.features import Features
+    oafeat = Features(api_url)
+    
+    # List of stations with no water level data
+    stations_with_data = copy.copy(stations)
+    stations_without_data = []
+
+    # Data retrieval and creation of the data frames
+    for station in stations:
+        output_csv_path = Path(collection_output_dir,f'{station}_{download_variable}.csv')
+        append_to_existing = incremental and output_csv_path.exists()
+
+        if append_to_existing:
+            last_time = _last_stored_time(output_csv_path, datetime_column)
+            append_to_existing = last_time is not None
+
+        if append_to_existing:
+            # Retrieval of the records newer than those already stored, within the time limits
+            incremental_time = _incremental_time_query(last_time, time_ if time_limits else None)
+            if incremental_time is None:
+                logger.info(f"{download_variable} from {collection} for station {station} already stored up to {end_date}")
+                continue
+            logger.info(f"Retrieving {download_variable} from {collection} for station {station} for {incremental_time}")
+            hydro_data = oafeat.collection_items(
+                collection,
+                limit=limit,
+                STATION_NUMBER=station,
+                time=incremental_time,
+            )
+        elif time_limits:
+            # Retrieval of water level data
+            hydro_data = oafeat.collection_items(
+                collection,
+                limit=limit,
+                STATION_NUMBER=station,
+                time=time_,
+            )
+        else:
+            # Retrieval of water level data
+            hydro_data = oafeat.collection_items(
+                collection,
+                limit=limit,
+                STATION_NUMBER=station,
+            )
+
+        # Creation of a data frame if there is data for the chosen time period
+        if hydro_data["features"]:
+            
+            # Creation of a dictionary in a format compatible with Pandas
+            historical_data_format = [
+                {
+                    **el["properties"],
+                }
+                for el in hydro_data["features"]
+            ]
+
+            # Creation of the data frame
+            historical_data_df = pd.DataFrame(
+                historical_data_format,
+                columns=query_variables,
+            )
+            
+            # Detect and convert data types of columns
+            historical_data_df = historical_data_df.infer_objects(copy=False)
+
+            # Creating an index with the date in a datetime format
+            historical_data_df[datetime_column] = pd.to_datetime(
+                historical_data_df[datetime_column]
+            )
+            historical_data_df.set_index([datetime_column], inplace=True, drop=True)
+
+            if append_to_existing:
+                historical_data_df = _append_to_station_csv(historical_data_df, output_csv_path, datetime_column)
+
+            historical_data_df.to_csv(output_csv_path, index=True)
+
+            logger.info(f"{download_variable} from {collection} for station {station} output to {output_csv_path}")
+
+        # No new records, the station keeps the data already stored
+        elif append_to_existing:
+            logger.info(f"No new {download_variable} from {collection} for station {station} since {last_time}")
+
+        # If there is no data for the chosen time period, the station
+        # will be removed from the dataset
+        else:
+            stations_without_data.append(station)
+
+
+    # Removing hydrometric stations without water level data from the station list
+    for station in stations_without_data:
+        logger.warning(
+            f"Station {station} has no {download_variable} data for the chosen time period."
+        )
+        stations_with_data.remove(station)
+
+    # Raising an error if no station is left in the list
+    if not stations:
+        stations_with_data = []
+        raise ValueError(
+            f"No {download_variable} data was returned from {collection}, please check the query."
+        )
+    
+    return stations_with_data
+
+def _next_link(page):
+    """
+    Href of the next page of an OGC API Features response, if any
+    """
+    for link in page.get('links', []):
+        if link.get('rel') == 'next':
+            return link.get('href')
+    return None
+
+def _get_page(session, url, params, max_retries=3, retry_backoff=2.0, timeout=300):
+    """
+    Get one page of an OGC API Features response, retrying server errors and timeouts with exponential backoff
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            # Client errors of the query are not retried
+            if attempt == max_retries or (isinstance(e, requests.HTTPError) and e.response.status_code < 500):
+                raise
+            delay = retry_backoff * 2 ** (attempt - 1)
+            logger.warning(f'Request {url} failed on attempt {attempt} ({e}), retrying in {delay:.1f} s')
+            time.sleep(delay)
+
+def stream_collection_items(session, api_url, collection, page_size=10000, max_retries=3, retry_backoff=2.0, timeout=300, **query):
+    """
+    Yield the features of a collection one page at a time, following the next links (or offsets) of the responses.
+    Each page is requested up to max_retries times, on server errors and after timeout seconds without response.
+    """
+    url = f"{api_url.rstrip('/')}/collections/{collection}/items"
+    params = {'f': 'json', 'limit': page_size, **query}
+    offset = 0
+
+    while url is not None:
+        page = _get_page(session, url, params, max_retries, retry_backoff, timeout)
+        features = page.get('features', [])
+        if features:
+            yield features
+
+        next_url = _next_link(page)
+        if next_url is not None:
+            # The next link carries the full query
+            url, params = next_url, None
+        elif params is not None and len(features) == page_size:
+            # Server without next links, page through with offsets
+            offset += page_size
+            params = {**params, 'offset': offset}
+        else:
+            url = None
+
+def _stream_station_to_csv(session, station, collection, download_variable, datetime_column, api_url, output_csv_path,
+                           query_variables, time_=None, page_size=10000, incremental=False, max_retries=3, retry_backoff=2.0, timeout=300):
+    """
+    Retrieve the data of one station page by page, writing each page to the station csv file as it arrives.
+    Returns the number of records retrieved.
+    """
+    append_to_existing = incremental and output_csv_path.exists()
+    if append_to_existing:
+        last_time = _last_stored_time(output_csv_path, datetime_column)
+        append_to_existing = last_time is not None
+        if append_to_existing:
+            time_ = _incremental_time_query(last_time, time_)
+            if time_ is None:
+                logger.info(f"{download_variable} from {collection} for station {station} already stored up to the end date")
+                return 0
+
+    query = {'STATION_NUMBER': station}
+    if time_ is not None:
+        query['time'] = time_
+
+    # Pages are written to a temporary file, so a failed retrieval never leaves a partial station file
+    tmp_csv_path = output_csv_path.with_suffix('.csv.tmp')
+    tmp_csv_path.unlink(missing_ok=True)
+    n_records = 0
+    for features in stream_collection_items(session, api_url, collection, page_size, max_retries, retry_backoff, timeout, **query):
+        page_df = pd.DataFrame([el["properties"] for el in features], columns=query_variables)
+        page_df[datetime_column] = pd.to_datetime(page_df[datetime_column])
+        page_df.set_index([datetime_column], inplace=True, drop=True)
+        page_df.to_csv(tmp_csv_path, mode='a', header=n_records == 0, index=True)
+        n_records += len(page_df)
+
+    if n_records == 0:
+        return 0
+
+    if append_to_existing:
+        new_data_df = pd.read_csv(tmp_csv_path, index_col=datetime_column)
+        new_data_df.index = pd.to_datetime(new_data_df.index)
+        _append_to_station_csv(new_data_df, output_csv_path, datetime_column).to_csv(tmp_csv_path, index=True)
+
+    os.replace(tmp_csv_path, output_csv_path)
+
+    return n_records
+
+def _last_stored_time_in_store(store_dir, collection, download_variable, station, datetime_column):
+    """
+    Latest timestamp of a station already in the station store, formatted for an OGC API time query
+    """
+    from .station_store import station_partition_dir, read_station_data
+
+    if not station_partition_dir(store_dir, collection, download_variable, station).exists():
+        return None
+    last_time = read_station_data(store_dir, collection, download_variable, [station], columns=[]).index.max()
+
+    return _format_query_time(last_time)
+
+def _stream_station_to_store(session, station, collection, download_variable, datetime_column, api_url, store_dir,
+                             query_variables, time_=None, page_size=10000, incremental=False, max_retries=3, retry_backoff=2.0,
+                             timeout=300):
+    """
+    Retrieve the data of one station page by page and write it to the station store (see station_store).
+    With incremental, only the records newer than those stored are requested, and appended as a new part.
+    Returns the number of records retrieved.
+    """
+    from .station_store import write_station_data
+
+    last_time = _last_stored_time_in_store(store_dir, collection, download_variable, station, datetime_column) if incremental else None
+    if last_time is not None:
+        time_ = _incremental_time_query(last_time, time_)
+        if time_ is None:
+            logger.info(f"{download_variable} from {collection} for station {station} already stored up to the end date")
+            return 0
+
+    query = {'STATION_NUMBER': station}
+    if time_ is not None:
+        query['time'] = time_
+
+    # The pages are written once all are retrieved, so a failed retrieval never leaves a partial station series
+    pages = []
+    for features in stream_collection_items(session, api_url, collection, page_size, max_retries, retry_backoff, timeout, **query):
+        page_df = pd.DataFrame([el["properties"] for el in features], columns=query_variables)
+        page_df.index = pd.DatetimeIndex(pd.to_datetime(page_df.pop(datetime_column), format='ISO8601'), name=datetime_column)
+        pages.append(page_df)
+
+    if not pages:
+        return 0
+
+    station_df = pd.concat(pages)
+    write_station_data(station_df, store_dir, collection, download_variable, station, append=last_time is not None)
+
+    return len(station_df)
+
+def retrieve_data_from_api_parallel(stations, collection, download_variable, datetime_column, api_url, output_dir, other_variables=[],
+                                    time_limits=False, start_date=None, end_date=None, page_size=10000, max_workers=4, incremental=False,
+                                    store_dir=None, max_retries=3, retry_backoff=2.0, timeout=300):
+    """
+    Retrieve data for a list of stations from an OGC API Features collection, several stations at a time.
+
+    Same outputs as retrieve_data_from_api, but each station is paged through with at most page_size records
+    per request, and every page is streamed to the station csv file instead of being held in memory.
+
+    Args:
+    max_workers (int): Maximum number of stations retrieved concurrently, each worker holds its own http session.
+    page_size (int): Number of records requested per page.
+    incremental (bool): Only retrieve the records newer than those stored in existing station csv files,
+        up to end_date with time_limits.
+    store_dir (str or Path): Optional station store directory. If given, the records are written to the station store
+        ({collection}/{download_variable}/STATION_NUMBER={station}) instead of the station csv files.
+    max_retries (int): Number of attempts for each page before the retrieval of the station fails.
+    retry_backoff (float): Delay in seconds before the first retry, doubled on each following retry.
+    timeout (float): Seconds to wait for each page before the attempt fails and is retried.
+
+    Returns:
+    list: The stations with data for the chosen time period. Stations still failing after the retries are
+    logged and left out, the retrieval of the other stations goes on.
+    """
+    time_ = f"{start_date}/{end_date}" if time_limits else None
+    logger.info(f"Retrieving {download_variable} from {collection} for {len(stations)} stations with {max_workers} workers")
+
+    query_variables = ["STATION_NUMBER", "STATION_NAME", datetime_column, download_variable] + other_variables
+
+    collection_output_dir = Path(output_dir,collection)
+    if store_dir is None:
+        collection_output_dir.mkdir(parents=True, exist_ok=True)
+
+    thread_data = threading.local()
+
+    def retrieve_station(station):
+        if not hasattr(thread_data, 'session'):
+            thread_data.session = requests.Session()
+        if store_dir is not None:
+            n_records = _stream_station_to_store(thread_data.session, station, collection, download_variable, datetime_column, api_url,
+                                                 store_dir, query_variables, time_, page_size, incremental,
+                                                 max_retries, retry_backoff, timeout)
+            logger.info(f"{n_records} records of {download_variable} from {collection} for station {station} output to the station store")
+            return n_records, Path(store_dir, collection, download_variable, f'STATION_NUMBER={station}').exists()
+
+        output_csv_path = Path(collection_output_dir,f'{station}_{download_variable}.csv')
+        n_records = _stream_station_to_csv(thread_data.session, station, collection, download_variable, datetime_column, api_url,
+                                           output_csv_path, query_variables, time_, page_size, incremental,
+                                           max_retries, retry_backoff, timeout)
+        logger.info(f"{n_records} records of {download_variable} from {collection} for station {station} output to {output_csv_path}")
+        return n_records, output_csv_path.exists()
+
+    results, failures = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(retrieve_station, station): station for station in stations}
+        for future in as_completed(futures):
+            station = futures[future]
+            try:
+                results[station] = future.result()
+            except Exception as e:
+                failures[station] = e
+                logger.error(f"Retrieval of {download_variable} from {collection} failed for station {station}: {e}")
+
+    stations_with_data = []
+    for station in stations:
+        if station in failures:
+            continue
+        n_records, has_file = results[station]
+        if n_records > 0 or (incremental and has_file):
+            stations_with_data.append(station)
+        else:
+            logger.warning(f"Station {station} has no {download_variable} data for the chosen time period.")
+
+    if failures:
+        logger.warning(f"{len(failures)} of {len(stations)} stations failed to retrieve from {collection}: {sorted(failures)}")
+
+    if not stations_with_data:
+        raise ValueError(
+            f"No {download_variable} data was returned from {collection}, please check the query."
+        )
+
+    return stations_with_data
@@ -0,0 +1,257 @@
+# Description: This script contains functions to store station time series in a columnar Parquet store.
+# The store is partitioned by collection, variable and station, each append adding a part file to the station partition:
+#   {store_dir}/{collection}/{variable}/STATION_NUMBER={station}/part-{write time}.parquet
+import re
+import time
+from pathlib import Path
+import logging
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATION_PARTITIONING = ds.partitioning(pa.schema([('STATION_NUMBER', pa.string())]), flavor='hive')
+
+def station_partition_dir(store_dir, collection, variable, station):
+    """
+    Directory of the part files of a station
+    """
+    return Path(store_dir, collection, variable, f'STATION_NUMBER={station}')
+
+def _part_files(partition_dir):
+    """
+    Part files of a station partition, in the order they were written
+    """
+    return sorted(Path(partition_dir).glob('part-*.parquet'))
+
+def _write_part(table, partition_dir):
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    path = Path(partition_dir, f'part-{time.time_ns()}.parquet')
+    tmp_path = path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path, compression='zstd')
+    tmp_path.replace(path)
+
+    return path
+
+def _is_string_type(field_type):
+    if pa.types.is_dictionary(field_type):
+        field_type = field_type.value_type
+    return pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+
+def _stored_table(df, stored_schema=None):
+    """
+    Table of a part file, with the column types of the parts already stored: repeated strings as dictionaries and
+    numbers as float64. A column without any value takes the type of the stored column, float64 if it has none,
+    as Parquet would otherwise store it with a null type that no value can be appended to.
+
+    Returns:
+    Table, bool: The table, and whether a column with strings was stored as float64 so far.
+    """
+    stored_types = {}
+    if stored_schema is not None:
+        stored_types = {name: stored_schema.field(name).type for name in stored_schema.names}
+
+    retype = False
+    for column in df.columns:
+        values = df[column]
+        stored_as_string = column in stored_types and _is_string_type(stored_types[column])
+        if pd.api.types.is_bool_dtype(values.dtype):
+            continue
+        if values.isna().all():
+            df[column] = values.astype(object).astype('category' if stored_as_string else 'float64')
+        elif stored_as_string:
+            df[column] = values.astype(object).where(values.isna(), values.astype(str)).astype('category')
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            df[column] = values.astype('float64')
+        elif values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+            df[column] = pd.to_numeric(values).astype('float64')
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = values.astype('category')
+            retype = retype or column in stored_types
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    # Categories without any value are stored with the dictionary type of the stored column
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type) and pa.types.is_null(field.type.value_type):
+            table = table.set_column(i, field.name, pa.nulls(table.num_rows, stored_types[field.name]))
+
+    return table, retype
+
+def write_station_data(df, store_dir, collection, variable, station, append=False, max_parts=32):
+    """
+    Write the time series of one station to the store.
+
+    An append only writes the new rows, as a new part file of the station partition. When read, the rows of
+    later parts replace the rows of earlier parts at the same timestamps. Once the partition holds more than
+    max_parts part files, they are compacted into one, so the stored rows are rewritten every max_parts appends.
+
+    Args:
+    df (DataFrame): Station data with a datetime index.
+    store_dir (str or Path): Root directory of the store.
+    collection (str): Name of the collection, e.g. hydrometric-realtime or DHPS_1km_RiverDischarge.
+    variable (str): Name of the variable, e.g. DISCHARGE.
+    station (str): Station number.
+    append (bool): If True, the data is added to the data already stored, otherwise it replaces the station partition.
+    max_parts (int): Number of part files above which an append compacts the partition.
+
+    Returns:
+    Path: The path of the part file written.
+    """
+    partition_dir = station_partition_dir(store_dir, collection, variable, station)
+    previous_parts = _part_files(partition_dir)
+
+    df = df.copy()
+    df.index = pd.to_datetime(df.index)
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+
+    # The station number is held by the partition
+    stored_schema = pq.read_schema(previous_parts[-1]) if previous_parts and append else None
+    table, retype = _stored_table(df.drop(columns='STATION_NUMBER', errors='ignore'), stored_schema)
+    if retype:
+        # Strings in a column stored without any value so far: the stored rows are rewritten with the new type
+        stored_df = read_station_partition(partition_dir)
+        df = pd.concat([stored_df[~stored_df.index.isin(df.index)].astype(object),
+                        df.drop(columns='STATION_NUMBER', errors='ignore').astype(object)]).sort_index()
+        table, _ = _stored_table(df)
+        append = False
+
+    path = _write_part(table, partition_dir)
+
+    if not append:
+        for part in previous_parts:
+            part.unlink()
+    elif len(previous_parts) + 1 > max_parts:
+        path = compact_station_data(store_dir, collection, variable, station)
+
+    return path
+
+def compact_station_data(store_dir, collection, variable, station):
+    """
+    Merge the part files of a station partition into a single part file.
+
+    Returns:
+    Path: The path of the compacted part file.
+    """
+    partition_dir = station_partition_dir(store_dir, collection, variable, station)
+    parts = _part_files(partition_dir)
+    if len(parts) <= 1:
+        return parts[0] if parts else None
+
+    table, _ = _stored_table(read_station_partition(partition_dir), pq.read_schema(parts[-1]))
+    path = _write_part(table, partition_dir)
+    for part in parts:
+        part.unlink()
+    logger.info(f'Compacted {len(parts)} parts of {collection}/{variable} station {station}')
+
+    return path
+
+def _time_scalar(value, field_type):
+    """
+    Timestamp converted to the type of the stored datetime column, so it can be used in a filter
+    """
+    value = pd.Timestamp(value)
+    if field_type.tz is not None and value.tzinfo is None:
+        value = value.tz_localize(field_type.tz)
+    elif field_type.tz is None and value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+
+    return pa.scalar(value, type=field_type)
+
+def read_station_data(store_dir, collection, variable, stations=None, start=None, end=None, columns=None):
+    """
+    Read station time series from the store, only reading the partitions and row groups that match the query.
+
+    Args:
+    store_dir (str or Path): Root directory of the store.
+    collection (str): Name of the collection.
+    variable (str): Name of the variable.
+    stations (list): Optional station numbers to read, all stations if None.
+    start, end (str or Timestamp): Optional inclusive time range.
+    columns (list): Optional subset of the columns to read.
+
+    Returns:
+    DataFrame: The station data with a datetime index and a STATION_NUMBER column, sorted by station and time.
+    """
+    variable_dir = Path(store_dir, collection, variable)
+    # Only the partitions of the stations are listed, their parts in write order
+    if stations is not None:
+        partition_dirs = [Path(variable_dir, f'STATION_NUMBER={station}') for station in dict.fromkeys(stations)]
+    else:
+        partition_dirs = sorted(variable_dir.glob('STATION_NUMBER=*'))
+    part_lists = [_part_files(partition_dir) for partition_dir in partition_dirs]
+    files = [str(part) for parts in part_lists for part in parts]
+    if not files:
+        raise FileNotFoundError(f'No stored data for {collection}/{variable} stations {stations}')
+
+    dataset = ds.dataset(files, format='parquet', partitioning=STATION_PARTITIONING, partition_base_dir=str(variable_dir))
+
+    datetime_column = dataset.schema.pandas_metadata['index_columns'][0]
+    datetime_type = dataset.schema.field(datetime_column).type
+
+    expression = None
+    filters = []
+    if stations is not None:
+        filters.append(pc.field('STATION_NUMBER').isin(list(stations)))
+    if start is not None:
+        filters.append(pc.field(datetime_column) >= _time_scalar(start, datetime_type))
+    if end is not None:
+        filters.append(pc.field(datetime_column) <= _time_scalar(end, datetime_type))
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+
+    if columns is not None:
+        columns = list(dict.fromkeys([datetime_column, 'STATION_NUMBER'] + list(columns)))
+
+    # The scan keeps the order of the files, so the rows of later parts replace the earlier ones
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+    if datetime_column not in df.columns:
+        df = df.reset_index()
+    if any(len(parts) > 1 for parts in part_lists):
+        df = df[~df.duplicated(subset=['STATION_NUMBER', datetime_column], keep='last')]
+        df = df.sort_values(['STATION_NUMBER', datetime_column], kind='stable')
+
+    return df.set_index(datetime_column)
+
+def read_station_partition(partition_dir, start=None, end=None):
+    """
+    Read the time series of one station from its partition directory (see station_partition_dir).
+
+    Returns:
+    DataFrame: The station data with a datetime index, without the STATION_NUMBER column.
+    """
+    partition_dir = Path(partition_dir)
+    variable_dir = partition_dir.parent
+    station = partition_dir.name.split('=', 1)[1]
+
+    df = read_station_data(variable_dir.parents[1], variable_dir.parent.name, variable_dir.name, [station], start, end)
+
+    return df.drop(columns='STATION_NUMBER')
+
+def convert_csv_output_to_store(output_dir, store_dir):
+    """
+    Convert the station csv files of the workflow outputs to the store:
+    {collection}/{station}_{variable}.csv, {layer}/{station}_forecast.csv and {layer}/{station}_analysis.csv
+
+    Returns:
+    list: The paths of the station partitions written.
+    """
+    written = []
+    for csv_path in sorted(Path(output_dir).glob('*/*.csv')):
+        match = re.match(r'^(?P<station>[0-9]{2}[A-Z]{2}[0-9]{3})_(?P<variable>.+)$', csv_path.stem)
+        if match is None:
+            continue
+
+        collection = csv_path.parent.name
+        df = pd.read_csv(csv_path, index_col=0)
+        df.index = pd.to_datetime(df.index)
+
+        written.append(write_station_data(df, store_dir, collection, match['variable'], match['station']))
+        logger.info(f'{csv_path} converted to the station store')
+
+    return written
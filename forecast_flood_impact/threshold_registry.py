@@ -0,0 +1,222 @@
+# Description: Registry of the return period thresholds of every station, loaded once into a contiguous
+# stations x T_yrs matrix, with exceedance class and continuous return period lookups.
+import logging
+import math
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+def reduced_variate(t_yrs):
+    """
+    Gumbel reduced variate of a return period, in which the fitted frequency curves are close to straight lines
+    """
+    return -np.log(-np.log(1.0 - 1.0 / np.asarray(t_yrs, dtype=float)))
+
+def _return_period_of_variate(y):
+    return 1.0 / (1.0 - np.exp(-np.exp(-y)))
+
+class ThresholdRegistry:
+    """
+    Return period thresholds of many stations, for fast lookups of the exceeded class or the return period of a value.
+
+    The thresholds are held in a C-contiguous stations x T_yrs matrix, with a station to row index.
+    Return periods between the tabulated T_yrs are interpolated linearly in the Gumbel reduced variate
+    (probability paper), and extrapolated along the first and last segments of the curve.
+
+    As the classification always did, a value is in the class of the largest return period whose threshold it
+    exceeds, and a missing threshold is never exceeded. The matrix holds the thresholds as the classes see them:
+    the reverse cumulative minimum over T_yrs, missing thresholds being infinite, so every row increases with T_yrs.
+    Stations with missing or decreasing thresholds are logged with a warning, return periods without a value are
+    left out and duplicate stations raise a ValueError.
+
+    Args:
+    t_yrs (array): Return periods of the threshold columns.
+    stations (list): Station numbers of the threshold rows.
+    thresholds (array): Threshold discharge of each station (rows) and return period (columns).
+    """
+    def __init__(self, t_yrs, stations, thresholds):
+        t_yrs = np.asarray(t_yrs)
+        # Return periods without a value are left out, sorted last
+        order = np.argsort(t_yrs)[:np.count_nonzero(pd.notna(t_yrs))]
+        self.t_yrs = t_yrs[order]
+        stations = pd.Index(stations)
+        table = np.asarray(thresholds, dtype=float).reshape(len(stations), -1)[:, order]
+
+        if stations.has_duplicates:
+            raise ValueError(f'Duplicate stations in the thresholds: {stations[stations.duplicated()].tolist()}')
+
+        missing = np.isnan(table).any(axis=1)
+        if missing.any():
+            logger.warning(f'Missing thresholds for stations {stations[missing].tolist()}, never exceeded')
+        decreasing = (np.diff(table, axis=1) < 0).any(axis=1)
+        if decreasing.any():
+            logger.warning(f'Thresholds decrease with T_yrs for stations {stations[decreasing].tolist()}, '
+                           f'classified by the largest return period exceeded')
+
+        # The class of a return period is exceeded when the threshold of this or any larger return period is
+        matrix = np.minimum.accumulate(np.where(np.isnan(table), np.inf, table)[:, ::-1], axis=1)[:, ::-1]
+
+        self.stations = stations
+        self.table = table
+        self.matrix = np.ascontiguousarray(matrix)
+        self.row = {station: i for i, station in enumerate(self.stations)}
+        self._y = reduced_variate(self.t_yrs)
+        # Segments of equal thresholds have no width and segments up to a missing threshold an infinite width,
+        # they are never interpolated in and are extrapolated flat
+        with np.errstate(invalid='ignore'):
+            widths = np.diff(self.matrix, axis=1)
+        self._slopes = np.divide(np.diff(self._y), widths, out=np.zeros_like(widths), where=widths > 0)
+
+        # Plain python rows for the scalar lookups, which are faster than numpy calls on a handful of values
+        self._row_values = self.matrix.tolist()
+        self._row_slopes = self._slopes.tolist()
+        self._y_values = self._y.tolist()
+
+    @classmethod
+    def from_table(cls, threshold_df):
+        """
+        Registry of a threshold table as in ffa_summary_for_tool.csv, a T_yrs column and one column per station.
+        """
+        thresholds = threshold_df.drop(columns='T_yrs')
+
+        return cls(threshold_df['T_yrs'].to_numpy(), thresholds.columns, thresholds.to_numpy(dtype=float).T)
+
+    def __contains__(self, station):
+        return station in self.row
+
+    def __len__(self):
+        return len(self.stations)
+
+    def thresholds(self, station):
+        """
+        Thresholds of a station as in the table, in the order of t_yrs, NaN where missing
+        """
+        return self.table[self.row[station]]
+
+    def return_period(self, station, value):
+        """
+        Continuous return period of a single value at a station, NaN for a missing value.
+        """
+        if value != value:
+            return math.nan
+
+        values = self._row_values[self.row[station]]
+        # Segment of the frequency curve holding the value, the outer segments are extended
+        segment = min(max(bisect_right(values, value), 1), len(values) - 1) - 1
+        y = self._y_values[segment] + (value - values[segment]) * self._row_slopes[self.row[station]][segment]
+
+        return 1.0 / (1.0 - math.exp(-math.exp(-y)))
+
+    def _rows(self, stations):
+        rows = self.stations.get_indexer(np.asarray(stations))
+        unknown = rows < 0
+        if unknown.any():
+            logger.warning(f'No thresholds available for stations {sorted(set(np.asarray(stations)[unknown]))}')
+        return rows, unknown
+
+    def _counts(self, rows, values):
+        """
+        Number of thresholds exceeded by each value, at rows of stations with thresholds
+        """
+        # One threshold column at a time, so the memory stays in the order of the number of values
+        counts = np.zeros(len(values), dtype=np.int16)
+        for column in range(len(self.t_yrs)):
+            # Missing values never exceed a threshold
+            counts += values >= self.matrix[rows, column]
+
+        return counts
+
+    def exceeded_counts(self, stations, values):
+        """
+        Number of thresholds exceeded (value >= threshold) by each value, -1 for stations without thresholds.
+
+        Since the thresholds increase with T_yrs, a count of k means t_yrs[k - 1] is the largest return period exceeded.
+        """
+        rows, unknown = self._rows(stations)
+        values = np.asarray(values, dtype=float)
+
+        counts = np.full(len(values), -1, dtype=np.int16)
+        counts[~unknown] = self._counts(rows[~unknown], values[~unknown])
+
+        return counts
+
+    def return_periods(self, stations, values):
+        """
+        Continuous return period of each value at its station, NaN for missing values and stations without thresholds.
+
+        Args:
+        stations (array): Station of each value.
+        values (array): Discharge values.
+
+        Returns:
+        ndarray: The return period of each value.
+        """
+        rows, unknown = self._rows(stations)
+        values = np.asarray(values, dtype=float)
+
+        return_periods = np.full(len(values), np.nan)
+        rows, known_values = rows[~unknown], values[~unknown]
+        # Segment of the frequency curve holding each value, the outer segments are extended
+        segment = np.clip(self._counts(rows, known_values), 1, len(self.t_yrs) - 1) - 1
+
+        y = self._y[segment] + (known_values - self.matrix[rows, segment]) * self._slopes[rows, segment]
+        return_periods[~unknown] = _return_period_of_variate(y)
+
+        return return_periods
+
+def _analysis_quantiles(analysis_dir):
+    """
+    Quantiles (Yp by T_yrs) of the distribution fitted by the stationary frequency analysis of a station, if any
+    """
+    quantiles_csv = Path(analysis_dir, 'SFFA_Results', 'Lmom_Bootstrap_Estimates.csv')
+    if not quantiles_csv.exists():
+        return None
+
+    return pd.read_csv(quantiles_csv).set_index('T_yrs')['Yp']
+
+@lru_cache(maxsize=None)
+def load_threshold_registry(threshold_csv, ffa_dir=None):
+    """
+    Load the threshold registry once per process.
+
+    The thresholds of ffa_summary_for_tool.csv are used for every station. If ffa_dir is given, the quantiles of
+    the fitted distribution of each station with a stationary analysis ({station}_analysis/SFFA_Results) are read
+    at full precision from its estimates, T_yrs missing from the estimates keeping the summary table thresholds.
+    The quantiles of the nonstationary analyses depend on their covariate and are only available in the summary table.
+
+    Args:
+    threshold_csv (str or Path): Threshold table, a T_yrs column and one column per station.
+    ffa_dir (str or Path): Optional flood frequency analysis directory holding the {station}_analysis results.
+
+    Returns:
+    ThresholdRegistry: The thresholds of all stations.
+    """
+    threshold_df = pd.read_csv(threshold_csv).set_index('T_yrs')
+
+    if ffa_dir is not None:
+        for analysis_dir in sorted(Path(ffa_dir).glob('*_analysis')):
+            station = analysis_dir.name[:-len('_analysis')]
+            quantiles = _analysis_quantiles(analysis_dir)
+            if quantiles is not None:
+                quantiles = quantiles.reindex(threshold_df.index)
+                if station in threshold_df:
+                    quantiles = quantiles.fillna(threshold_df[station])
+                threshold_df[station] = quantiles
+
+    registry = ThresholdRegistry(threshold_df.index.to_numpy(), threshold_df.columns, threshold_df.to_numpy(dtype=float).T)
+    logger.info(f'Loaded the thresholds of {len(registry)} stations for T_yrs {registry.t_yrs.tolist()}')
+
+    return registry
+
+def as_threshold_registry(thresholds):
+    """
+    Registry of a threshold table (as in ffa_summary_for_tool.csv), or the registry itself
+    """
+    if isinstance(thresholds, ThresholdRegistry):
+        return thresholds
+    return ThresholdRegistry.from_table(thresholds)